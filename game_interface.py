@@ -9,23 +9,269 @@ strategy cannot be used on Chopsticks unless you account for infinite loops.
 your own curiousity!)
 """
 
-from typing import Any, Callable
-from subtract_square_game import SubtractSquareGame
-from stonehenge import Stonehenge
-from tictactoe import TicTacToe
-from strategy import iterative_strategy, recursive_strategy, \
-    interactive_strategy, rough_outcome_strategy
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import time
+from registry import Registry
 
-playable_games = {'s': SubtractSquareGame,
-                  'h': Stonehenge,
-                  't': TicTacToe}
+# Games and strategies are only imported when they are first looked up, and
+# installed packages can add their own through the entry point groups below
+playable_games = Registry({'s': 'subtract_square_game:SubtractSquareGame',
+                           'h': 'stonehenge:Stonehenge',
+                           't': 'tictactoe:TicTacToe',
+                           'k': 'mnk_game:MNKGame',
+                           'g': 'subtraction_game:SubtractionGame'},
+                          'game_interface.games')
+
+
+def _check_options(valid: bool) -> None:
+    """
+    Raise ValueError unless the numbers setting up a game are valid.
+    """
+    if not valid:
+        raise ValueError('invalid game options')
+
+
+def _subtract_square_options(numbers: List[int]) -> Dict[str, Any]:
+    """
+    Return the options of a Subtract Square game from the number to subtract
+    from.
+    """
+    _check_options(len(numbers) == 1 and numbers[0] > 0)
+    return {'count': numbers[0]}
+
+
+def _stonehenge_options(numbers: List[int]) -> Dict[str, Any]:
+    """
+    Return the options of a Stonehenge game from its side length.
+    """
+    _check_options(len(numbers) == 1 and
+                   1 <= numbers[0] <= playable_games['h'].MAX_SIDE_LENGTH)
+    return {'side_length': numbers[0]}
+
+
+def _tictactoe_options(numbers: List[int]) -> Dict[str, Any]:
+    """
+    Return the options of a TicTacToe game, which takes no numbers.
+    """
+    _check_options(not numbers)
+    return {}
+
+
+def _mnk_options(numbers: List[int]) -> Dict[str, Any]:
+    """
+    Return the options of an m,n,k-game from its rows, columns and marks in
+    a row needed to win.
+    """
+    _check_options(len(numbers) == 3 and min(numbers) >= 1 and
+                   numbers[2] <= max(numbers[:2]))
+    return {'size': tuple(numbers)}
+
+
+def _subtraction_options(numbers: List[int]) -> Dict[str, Any]:
+    """
+    Return the options of a subtraction game from the number to subtract
+    from followed by the amounts that can be subtracted.
+
+    >>> _subtraction_options([5, 0])
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid game options
+    """
+    _check_options(len(numbers) >= 2 and min(numbers) > 0)
+    return {'count': numbers[0], 'amounts': numbers[1:]}
+
+
+# How to turn a list of numbers into the keyword arguments that set up each
+# game without asking for input (see game_server.py), raising ValueError for
+# the numbers the game's own prompts would not accept
+GAME_OPTIONS = {
+    's': _subtract_square_options,
+    'h': _stonehenge_options,
+    't': _tictactoe_options,
+    'k': _mnk_options,
+    'g': _subtraction_options,
+}  # type: Dict[str, Callable[[List[int]], Dict[str, Any]]]
 
 # 'mr' should map to your recursive implementation of minimax while
 # 'mi' should map to your iterative implementation of minimax
-usable_strategies = {'i': interactive_strategy,
-                     'ro': rough_outcome_strategy,
-                     'mr': recursive_strategy,
-                     'mi': iterative_strategy}
+usable_strategies = Registry({'i': 'strategy:interactive_strategy',
+                              'ro': 'strategy:rough_outcome_strategy',
+                              'mr': 'strategy:recursive_strategy',
+                              'mi': 'strategy:iterative_strategy',
+                              'md': 'strategy:depth_limited_strategy',
+                              'mp': 'parallel_search:ParallelSearch',
+                              'mb': 'strategy:budgeted_strategy',
+                              'ms': 'strategy:SearchSession'},
+                             'game_interface.strategies')
+
+
+def new_strategy(strategy: Any) -> Callable[[Any], Any]:
+    """
+    Return strategy, or a new instance of it for one game if it is a class:
+    a strategy that keeps what it learns between turns, and may have an
+    advance method to call with each new state of the game.
+
+    >>> from strategy import SearchSession
+    >>> isinstance(new_strategy(SearchSession), SearchSession)
+    True
+    """
+    if isinstance(strategy, type):
+        return strategy()
+    return strategy
+
+
+class TimeControl:
+    """
+    A player's chess clock: a budget of time for each move, a total budget
+    that gains an increment after each move, or both.
+
+    per_move - seconds allowed for each move, or None for no limit
+    total - seconds allowed for the whole game, or None for no limit
+    increment - seconds added to remaining after each move made in time
+    forfeit - whether a player who goes over budget loses the game, rather
+              than having fallback pick the move instead
+    fallback - the strategy that picks moves for a player over budget, or
+               None for usable_strategies['ro']
+    remaining - seconds left of total, or None
+    think_times - seconds spent picking each move so far
+    """
+    per_move: Optional[float]
+    total: Optional[float]
+    increment: float
+    forfeit: bool
+    fallback: Callable[[Any], Any]
+    remaining: Optional[float]
+    think_times: List[float]
+
+    def __init__(self, per_move: float = None, total: float = None,
+                 increment: float = 0.0, forfeit: bool = True,
+                 fallback: Callable[[Any], Any] = None) -> None:
+        """
+        Initialize this TimeControl with a budget of per_move seconds for
+        each move and total seconds for the game, plus increment seconds
+        after each move.
+
+        >>> clock = TimeControl(total=60, increment=2)
+        >>> clock.time_left()
+        60
+        """
+        self.per_move = per_move
+        self.total = total
+        self.increment = increment
+        self.forfeit = forfeit
+        self.fallback = fallback
+        self.remaining = total
+        self.think_times = []
+
+    @staticmethod
+    def from_string(string: str) -> Optional['TimeControl']:
+        """
+        Return the TimeControl string describes: seconds per move such as
+        '5', a total and increment such as '300+2', or None for ''.
+
+        >>> TimeControl.from_string('300+2').increment
+        2.0
+        >>> TimeControl.from_string('5').per_move
+        5.0
+        """
+        string = string.strip()
+        if not string:
+            return None
+        if '+' in string:
+            total, increment = string.split('+')
+            return TimeControl(total=float(total), increment=float(increment))
+        return TimeControl(per_move=float(string))
+
+    def time_left(self) -> Optional[float]:
+        """
+        Return the seconds the player has for the next move, or None if there
+        is no limit.
+
+        >>> TimeControl(per_move=5, total=3).time_left()
+        3
+        """
+        limits = [x for x in (self.per_move, self.remaining) if x is not None]
+        return min(limits) if limits else None
+
+    def record(self, seconds: float) -> bool:
+        """
+        Record that the player spent seconds on a move, and return whether
+        that was within their budget.
+
+        >>> clock = TimeControl(total=10, increment=1)
+        >>> clock.record(4), clock.remaining
+        (True, 7)
+        >>> clock.record(8), clock.remaining
+        (False, -1)
+        """
+        budget = self.time_left()
+        self.think_times.append(seconds)
+        in_time = budget is None or seconds <= budget
+        if self.remaining is not None:
+            self.remaining -= seconds
+            if in_time:
+                self.remaining += self.increment
+        return in_time
+
+
+def _run_strategy(connection: Any, strategy: Callable[[Any], Any],
+                  game: Any) -> None:
+    """
+    Send the valid move strategy picks for game through connection, with
+    strategy itself if it keeps state between turns (or else None), or the
+    exception it raised. This runs in the worker process of
+    run_with_deadline.
+    """
+    try:
+        move = None
+        while not game.current_state.is_valid_move(move):
+            move = strategy(game)
+        connection.send((True, (move, strategy if hasattr(strategy, 'advance')
+                                else None)))
+    except Exception as error:
+        connection.send((False, error))
+    finally:
+        connection.close()
+
+
+def run_with_deadline(strategy: Callable[[Any], Any], game: Any,
+                      seconds: float) -> Optional[Tuple[Any, Any]]:
+    """
+    Return the valid move strategy picks for game, and the strategy as it is
+    after picking it if it keeps state between turns (or else None), or
+    return None if it takes more than seconds. The strategy runs in a worker
+    process, on a copy of game, which is stopped at the deadline.
+
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> move, updated = run_with_deadline(usable_strategies['mi'],
+    ...                                   SubtractSquareGame(True, 18), 10)
+    >>> move in [1, 16], updated
+    (True, None)
+    """
+    # imported here since only timed games need it
+    import multiprocessing
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    worker = multiprocessing.Process(target=_run_strategy,
+                                     args=(sender, strategy, game),
+                                     daemon=True)
+    worker.start()
+    sender.close()
+    try:
+        if not receiver.poll(seconds):
+            return None
+        try:
+            finished, result = receiver.recv()
+        except EOFError:
+            raise RuntimeError('the strategy process exited without a move')
+        if not finished:
+            raise result
+        return result
+    finally:
+        receiver.close()
+        if worker.is_alive():
+            worker.kill()
+        worker.join()
 
 
 class GameInterface:
@@ -35,11 +281,18 @@ class GameInterface:
     """
 
     def __init__(self, game: Any, p1_strategy: Callable,
-                 p2_strategy: Callable[[Any], Any]) -> None:
+                 p2_strategy: Callable[[Any], Any],
+                 p1_clock: TimeControl = None,
+                 p2_clock: TimeControl = None) -> None:
         """
         Initialize this GameInterface, setting its active game to game, and
         using the strategies p1_strategy for Player 1 and p2_strategy for
-        Player 2.
+        Player 2, timed by p1_clock and p2_clock if they are given.
+
+        A strategy with a time_left parameter is passed the seconds its
+        player has left for each move. A strategy that is a class is
+        instantiated for this game, and its advance method, if any, is
+        called with each new state.
 
         :param game: The game to be played.
         :type game:
@@ -47,6 +300,10 @@ class GameInterface:
         :type p1_strategy:
         :param p2_strategy: The strategy for Play 2.
         :type p2_strategy:
+        :param p1_clock: The time control for Player 1, or None.
+        :type p1_clock: TimeControl
+        :param p2_clock: The time control for Player 2, or None.
+        :type p2_clock: TimeControl
         """
         first_player = input("Type y if player 1 is to make the first move: ")
         is_p1_turn = False
@@ -54,8 +311,81 @@ class GameInterface:
             is_p1_turn = True
 
         self.game = game(is_p1_turn)
-        self.p1_strategy = p1_strategy
-        self.p2_strategy = p2_strategy
+        self.p1_strategy = new_strategy(p1_strategy)
+        self.p2_strategy = new_strategy(p2_strategy)
+        self.clocks = {'p1': p1_clock, 'p2': p2_clock}
+        # the player who lost by going over their time budget, if any
+        self.forfeited = None
+
+    def pick_move(self, player: str) -> Any:
+        """
+        Return a valid move picked by the strategy of player for the current
+        state, timing it against the player's clock. A player over budget
+        either forfeits, in which case None is returned, or has the move
+        picked by the clock's fallback strategy instead.
+
+        A timed strategy without a time_left parameter is run in a worker
+        process (see run_with_deadline), which is stopped once the budget is
+        spent.
+        """
+        current_state = self.game.current_state
+        strategy = self.p1_strategy if player == 'p1' else self.p2_strategy
+        clock = self.clocks[player]
+        budget = None if clock is None else clock.time_left()
+        fallback = None
+        if clock is not None:
+            fallback = clock.fallback or usable_strategies['ro']
+        if budget is not None and budget <= 0 and not clock.forfeit:
+            # out of time already: only the fallback can move
+            strategy = fallback
+        kwargs = {}
+        if budget is not None:
+            # imported here since it is slow to import and only timed games
+            # need it
+            import inspect
+            if 'time_left' in inspect.signature(strategy).parameters:
+                kwargs['time_left'] = budget
+        start = time.perf_counter()
+        move_to_make = None
+        if (budget is None or kwargs or strategy is fallback or
+                strategy is usable_strategies['i']):
+            # no time limit, or one the strategy keeps to by itself (or a
+            # person, who cannot be interrupted)
+            while not current_state.is_valid_move(move_to_make):
+                move_to_make = strategy(self.game, **kwargs)
+        else:
+            result = run_with_deadline(strategy, self.game, max(budget, 0))
+            if result is not None:
+                move_to_make, updated = result
+                if updated is not None:
+                    # keep what the strategy learnt in the worker process
+                    if player == 'p1':
+                        self.p1_strategy = updated
+                    else:
+                        self.p2_strategy = updated
+        if clock is not None and (
+                not clock.record(time.perf_counter() - start) or
+                move_to_make is None):
+            if clock.forfeit:
+                self.forfeited = player
+                return None
+            if strategy is not fallback:
+                self.game.current_state = current_state
+                move_to_make = fallback(self.game)
+        return move_to_make
+
+    def advance_strategies(self, state: Any) -> None:
+        """
+        Tell the strategies that keep state between turns that state is the
+        new state of the game.
+        """
+        strategies = [self.p1_strategy]
+        if self.p2_strategy is not self.p1_strategy:
+            strategies.append(self.p2_strategy)
+        for strategy in strategies:
+            advance = getattr(strategy, 'advance', None)
+            if advance is not None:
+                advance(state)
 
     def play(self) -> None:
         """
@@ -67,34 +397,45 @@ class GameInterface:
         print(current_state)
 
         # Pick moves until the game is over
-        while not self.game.is_over(current_state):
+        while not current_state.is_terminal():
             move_to_make = None
 
             # Print out all of the valid moves
-            possible_moves = current_state.get_possible_moves()
+            possible_moves = current_state.legal_moves()
             print("The current available moves are:")
             for move in possible_moves:
                 print(move)
 
-            # Pick a (legal) move.
-            while not current_state.is_valid_move(move_to_make):
-                current_strategy = self.p2_strategy
-                if current_state.get_current_player_name() == 'p1':
-                    current_strategy = self.p1_strategy
-                move_to_make = current_strategy(self.game)
+            # Pick a (legal) move, in time.
+            current_player_name = current_state.get_current_player_name()
+            move_to_make = self.pick_move(current_player_name)
+            if self.forfeited is not None:
+                break
 
             # Apply the move
-            current_player_name = current_state.get_current_player_name()
             new_game_state = current_state.make_move(move_to_make)
             self.game.current_state = new_game_state
             current_state = self.game.current_state
+            self.advance_strategies(current_state)
 
             print("{} made the move {}. The game's state is now:".format(
                 current_player_name, move_to_make))
             print(current_state)
 
+        # Print out the time each player spent thinking
+        for player in ['p1', 'p2']:
+            clock = self.clocks[player]
+            if clock is not None and clock.think_times:
+                print("{} thought for {:.3f}s over {} moves (longest "
+                      "{:.3f}s).".format(player, sum(clock.think_times),
+                                         len(clock.think_times),
+                                         max(clock.think_times)))
+
         # Print out the winner of the game
-        if self.game.is_winner("p1"):
+        if self.forfeited is not None:
+            print("{} ran out of time. Player {} is the winner!".format(
+                self.forfeited, 2 if self.forfeited == 'p1' else 1))
+        elif self.game.is_winner("p1"):
             print("Player 1 is the winner!")
         elif self.game.is_winner("p2"):
             print("Player 2 is the winner!")
@@ -103,14 +444,11 @@ class GameInterface:
 
 
 if __name__ == '__main__':
-    games = ", ".join(["'{}': {}".format(key, playable_games[key].__name__) if
-                       playable_games[key] is not None else
-                       "'{}': None".format(key) for key in playable_games])
+    games = ", ".join(["'{}': {}".format(key, playable_games.name(key))
+                       for key in playable_games])
 
     strategies = ", ".join(["'{}': {}".format(key,
-                                              usable_strategies[key].__name__)
-                            if usable_strategies[key] is not None else
-                            "'{}': None".format(key)
+                                              usable_strategies.name(key))
                             for key in usable_strategies])
 
     chosen_game = ''
@@ -127,5 +465,30 @@ if __name__ == '__main__':
     while p2 not in usable_strategies.keys():
         p2 = input("Select the strategy for Player 2 ({}): ".format(strategies))
 
-    GameInterface(playable_games[chosen_game], usable_strategies[p1],
-                  usable_strategies[p2]).play()
+    clocks = [None, None]
+    for i in range(2):
+        while True:
+            try:
+                clocks[i] = TimeControl.from_string(input(
+                    "Enter the time control for Player {} as seconds per "
+                    "move (e.g. 5), or total seconds + increment (e.g. "
+                    "300+2), or leave blank for none: ".format(i + 1)))
+                break
+            except ValueError:
+                print("Input is not valid.")
+
+    # GAME_TRACE names a file to write a trace of the searches to (see
+    # tracing.py), sampling GAME_TRACE_SAMPLE of the spans, nested at most
+    # GAME_TRACE_DEPTH deep
+    trace_path = os.environ.get('GAME_TRACE')
+    if trace_path:
+        import tracing
+        tracing.start_tracing(
+            float(os.environ.get('GAME_TRACE_SAMPLE', 1)),
+            int(os.environ.get('GAME_TRACE_DEPTH', 4)))
+    try:
+        GameInterface(playable_games[chosen_game], usable_strategies[p1],
+                      usable_strategies[p2], clocks[0], clocks[1]).play()
+    finally:
+        if trace_path:
+            tracing.stop_tracing(trace_path)
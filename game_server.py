@@ -0,0 +1,315 @@
+"""
+A TCP server hosting many games of a human against an AI at once.
+
+Clients send one command per line and get one reply line back, starting with
+OK or ERR (the reply to STATE is followed by the lines of the board):
+
+    NEW <game> <strategy> <y|n> [numbers...]
+        Start a game of playable_games[game] against the AI strategy
+        usable_strategies[strategy] (but not one of EXCLUDED_STRATEGIES).
+        y if the human moves first. The numbers configure the game (see
+        GAME_OPTIONS). Replies OK <id> <ai move>, where the AI move is - if
+        the human moves first.
+    MOVE <id> <move>
+        Make the human's move. Replies OK <ai move> <status>, where status
+        is playing, p1, p2 (the winner) or tie.
+    STATE <id>
+        Replies OK <status> <player to move> <lines>, then the board.
+    END <id>
+        Forget a game.
+    METRICS
+        Replies OK with the sessions, queue depth and AI move latencies.
+
+AI moves are picked in a bounded pool of worker processes, so a slow search
+never blocks the server.
+
+Run as a script to serve on a port (8148 by default).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import time
+from game import Game
+from game_interface import (GAME_OPTIONS, new_strategy, playable_games,
+                            usable_strategies)
+
+# Number of AI move latencies METRICS summarizes
+LATENCY_WINDOW = 1000
+
+# Strategies NEW does not accept: 'i' asks a terminal for moves, and 'mp'
+# would start a pool of processes of its own inside each worker
+EXCLUDED_STRATEGIES = ['i', 'mp']
+
+
+def pick_ai_move(game: Game, strategy: str) -> Any:
+    """
+    Return the move usable_strategies[strategy] picks for game. This runs in
+    a worker process, on a copy of game, so a strategy that keeps state
+    between turns starts afresh each move.
+    """
+    return new_strategy(usable_strategies[strategy])(game)
+
+
+def game_status(game: Game) -> str:
+    """
+    Return 'playing' if game is not over, or else the winner ('p1' or 'p2')
+    or 'tie'.
+    """
+    if not game.is_over(game.current_state):
+        return 'playing'
+    for player in ['p1', 'p2']:
+        if game.is_winner(player):
+            return player
+    return 'tie'
+
+
+class Session:
+    """
+    A game between a client and an AI.
+
+    game - the game being played
+    strategy - the key in usable_strategies of the AI's strategy
+    human - the player the client plays as ('p1' or 'p2')
+    lock - held while a move is being made, so moves are made in order
+    """
+    game: Game
+    strategy: str
+    human: str
+    lock: asyncio.Lock
+
+    def __init__(self, game: Game, strategy: str, human: str) -> None:
+        """
+        Initialize a Session of game, where the client plays human against
+        the AI strategy.
+        """
+        self.game = game
+        self.strategy = strategy
+        self.human = human
+        self.lock = asyncio.Lock()
+
+
+class GameServer:
+    """
+    A server for many concurrent Sessions, with AI moves picked in a pool of
+    worker processes.
+
+    sessions - the games being played, by id
+    workers - the number of worker processes, or None for one per CPU
+    pool - the worker processes
+    queued - number of AI moves waiting for or running in a worker
+    latencies - seconds taken by the last LATENCY_WINDOW AI moves, queueing
+                included
+    ai_moves - number of AI moves made
+    """
+    sessions: Dict[int, Session]
+    workers: Optional[int]
+    pool: concurrent.futures.ProcessPoolExecutor
+    queued: int
+    latencies: collections.deque
+    ai_moves: int
+
+    def __init__(self, workers: int = None) -> None:
+        """
+        Initialize a GameServer with a pool of workers processes (as many as
+        there are CPUs if workers is None).
+        """
+        self.sessions = {}
+        self.workers = workers
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        self.queued = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.ai_moves = 0
+        self._next_id = 1
+        self._server = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        """
+        Start listening on host and port (any free port if port is 0), and
+        return the port.
+        """
+        self._server = await asyncio.start_server(self.handle_client, host,
+                                                  port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        """
+        Stop listening and shut down the worker processes.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.pool.shutdown()
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the commands of one client until it disconnects.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for reply in await self.handle_line(line.decode().strip()):
+                    writer.write((reply + '\n').encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # the client went away, or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line: str) -> List[str]:
+        """
+        Return the lines of the reply to the command line.
+        """
+        words = line.split()
+        commands = {'NEW': self.new_game, 'MOVE': self.make_move,
+                    'STATE': self.get_state, 'END': self.end_game,
+                    'METRICS': self.get_metrics}
+        if not words or words[0].upper() not in commands:
+            return ['ERR unknown command']
+        try:
+            return await commands[words[0].upper()](words[1:])
+        except (ValueError, IndexError, KeyError, TypeError):
+            return ['ERR invalid arguments']
+        except Exception as error:
+            # anything else is a bug or a dead worker: report it rather than
+            # dropping the connection
+            return ['ERR {}'.format(type(error).__name__)]
+
+    async def ai_move(self, session: Session) -> Any:
+        """
+        Pick and make the AI's move in session, in a worker process, and
+        return it.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            move = await loop.run_in_executor(self.pool, pick_ai_move,
+                                              session.game, session.strategy)
+        except concurrent.futures.process.BrokenProcessPool:
+            # a worker died: later moves need a new pool
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            raise
+        finally:
+            self.queued -= 1
+        self.latencies.append(time.perf_counter() - start)
+        self.ai_moves += 1
+        game = session.game
+        game.current_state = game.current_state.make_move(move)
+        return move
+
+    async def new_game(self, args: List[str]) -> List[str]:
+        """
+        Start a Session: NEW <game> <strategy> <y|n> [numbers...].
+        """
+        key, strategy, first = args[0], args[1], args[2].lower()
+        if key not in playable_games or key not in GAME_OPTIONS:
+            return ['ERR unknown game']
+        if (strategy not in usable_strategies or
+                strategy in EXCLUDED_STRATEGIES):
+            return ['ERR unknown strategy']
+        options = GAME_OPTIONS[key]([int(x) for x in args[3:]])
+        game = playable_games[key](True, **options)
+        if first not in ['y', 'n'] or game.is_over(game.current_state):
+            return ['ERR invalid arguments']
+        session = Session(game, strategy, 'p1' if first == 'y' else 'p2')
+        ai_move = '-'
+        if session.human == 'p2':
+            async with session.lock:
+                ai_move = await self.ai_move(session)
+        # only a game that started is a session
+        session_id = self._next_id
+        self._next_id += 1
+        self.sessions[session_id] = session
+        return ['OK {} {}'.format(session_id, ai_move)]
+
+    async def make_move(self, args: List[str]) -> List[str]:
+        """
+        Make the client's move and the AI's reply: MOVE <id> <move>.
+        """
+        session = self.sessions[int(args[0])]
+        game = session.game
+        async with session.lock:
+            state = game.current_state
+            if (game.is_over(state) or
+                    state.get_current_player_name() != session.human):
+                return ['ERR not your turn']
+            move = game.str_to_move(' '.join(args[1:]))
+            if not state.is_valid_move(move):
+                return ['ERR invalid move']
+            game.current_state = state.make_move(move)
+            ai_move = '-'
+            if not game.is_over(game.current_state):
+                ai_move = await self.ai_move(session)
+            return ['OK {} {}'.format(ai_move, game_status(game))]
+
+    async def get_state(self, args: List[str]) -> List[str]:
+        """
+        Describe a Session: STATE <id>.
+        """
+        game = self.sessions[int(args[0])].game
+        lines = str(game.current_state).split('\n')
+        return ['OK {} {} {}'.format(
+            game_status(game),
+            game.current_state.get_current_player_name(),
+            len(lines))] + lines
+
+    async def end_game(self, args: List[str]) -> List[str]:
+        """
+        Forget a Session: END <id>.
+        """
+        del self.sessions[int(args[0])]
+        return ['OK']
+
+    async def get_metrics(self, args: List[str]) -> List[str]:
+        """
+        Report the number of sessions, the AI moves queued or running, and
+        the latency of AI moves in milliseconds: METRICS.
+        """
+        latencies = sorted(self.latencies)
+        p50, p95, worst = 0.0, 0.0, 0.0
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            worst = latencies[-1] * 1000
+        return ['OK sessions={} queue_depth={} ai_moves={} latency_p50_ms='
+                '{:.1f} latency_p95_ms={:.1f} latency_max_ms={:.1f}'.format(
+                    len(self.sessions), self.queued, self.ai_moves, p50, p95,
+                    worst)]
+
+
+async def serve(host: str, port: int, workers: int = None) -> None:
+    """
+    Serve games on host and port until interrupted.
+    """
+    server = GameServer(workers)
+    port = await server.start(host, port)
+    print('Serving games on {}:{}'.format(host, port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def parse_args(args: List[str] = None) -> Tuple[str, int, int]:
+    """
+    Return the host, port and number of workers given on the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--workers', type=int, default=None)
+    options = parser.parse_args(args)
+    return options.host, options.port, options.workers
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(*parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,91 @@
+"""
+Basic tests of the game server, played by a client over the loopback
+interface.
+"""
+import asyncio
+import unittest
+from game_server import GameServer
+
+
+class GameServerUnitTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = GameServer(workers=2)
+        port = await self.server.start('127.0.0.1', 0)
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1',
+                                                                 port)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.server.close()
+
+    async def request(self, line):
+        self.writer.write((line + '\n').encode())
+        await self.writer.drain()
+        return (await self.reader.readline()).decode().strip()
+
+    async def test_subtract_square_human_wins(self):
+        """
+        Test a game of SubtractSquare from 4, which the human wins right away.
+        """
+        reply = await self.request('NEW s mi y 4')
+        self.assertRegex(reply, r'^OK \d+ -$')
+        session_id = reply.split()[1]
+        self.assertEqual(await self.request('MOVE {} 4'.format(session_id)),
+                         'OK - p1')
+
+    async def test_ai_reply_and_state(self):
+        """
+        Test that the AI replies to a move, and that STATE shows the board.
+        """
+        session_id = (await self.request('NEW s mi y 18')).split()[1]
+        reply = await self.request('MOVE {} 1'.format(session_id))
+        self.assertEqual(reply.split()[-1], 'playing')
+        header = (await self.request('STATE {}'.format(session_id))).split()
+        self.assertEqual(header[:3], ['OK', 'playing', 'p1'])
+        board = (await self.reader.readline()).decode().strip()
+        self.assertEqual(board, 'Current total: {}'.format(
+            17 - int(reply.split()[1])))
+
+    async def test_invalid_commands(self):
+        """
+        Test that invalid moves and commands are rejected.
+        """
+        session_id = (await self.request('NEW t ro y')).split()[1]
+        self.assertEqual(await self.request('MOVE {} 10'.format(session_id)),
+                         'ERR invalid move')
+        self.assertEqual(await self.request('JUMP'), 'ERR unknown command')
+        self.assertEqual(await self.request('MOVE 999 1'),
+                         'ERR invalid arguments')
+        self.assertEqual(await self.request('NEW z ro y'), 'ERR unknown game')
+        self.assertEqual(await self.request('NEW s mp y 4'),
+                         'ERR unknown strategy')
+
+    async def test_invalid_game_options(self):
+        """
+        Test that games the interactive prompts would not set up are
+        rejected, without leaving a session behind.
+        """
+        for line in ['NEW h ro y 11', 'NEW g ro y 5', 'NEW g ro y 5 0',
+                     'NEW k ro n 2 2 5', 'NEW s mi n 0']:
+            self.assertEqual(await self.request(line),
+                             'ERR invalid arguments', line)
+        metrics = await self.request('METRICS')
+        self.assertIn('sessions=0', metrics)
+
+    async def test_concurrent_sessions_metrics(self):
+        """
+        Test that many sessions can be played at once, and that their AI moves
+        are counted in the metrics.
+        """
+        session_ids = [(await self.request('NEW t ro n')).split()[1]
+                       for _ in range(5)]
+        metrics = dict(x.split('=') for x in
+                       (await self.request('METRICS')).split()[1:])
+        self.assertEqual(metrics['sessions'], str(len(session_ids)))
+        self.assertEqual(metrics['ai_moves'], str(len(session_ids)))
+        self.assertEqual(metrics['queue_depth'], '0')
+
+
+if __name__ == '__main__':
+    unittest.main()
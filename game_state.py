@@ -3,7 +3,9 @@ The GameState superclass.
 
 NOTE: You do not have to run python-ta on this file.
 """
-from typing import Any
+from typing import Any, Iterator, List, Sequence, Tuple
+from random import Random
+import pickle
 
 
 class GameState:
@@ -13,11 +15,21 @@ class GameState:
     WIN - score if player is in a winning position
     LOSE - score if player is in a losing position
     DRAW - score if player is in a tied position
+    IN_PLACE - whether this state supports copy, apply_move and undo_move,
+               which search engines use to explore moves without allocating
+               a new state per move
     p1_turn - whether it is p1's turn or not
+
+    A state caches its legal moves the first time they are needed (see
+    legal_moves). Subclasses that change a state in place must reset the
+    cache with forget_moves(), and copy() may share it.
     """
+    # So that subclasses declaring __slots__ have no __dict__
+    __slots__ = ('_moves', '_move_set')
     WIN: int = 1
     LOSE: int = -1
     DRAW: int = 0
+    IN_PLACE: bool = False
     p1_turn: bool
 
     def __init__(self, is_p1_turn: bool) -> None:
@@ -27,6 +39,8 @@ class GameState:
 
         """
         self.p1_turn = is_p1_turn
+        self._moves = None
+        self._move_set = None
 
     def __str__(self) -> str:
         """
@@ -40,6 +54,46 @@ class GameState:
         """
         raise NotImplementedError
 
+    def legal_moves(self) -> Tuple[Any, ...]:
+        """
+        Return the moves of get_possible_moves() as a tuple, only computed
+        the first time it is needed.
+        """
+        if self._moves is None:
+            self._moves = tuple(self.get_possible_moves())
+        return self._moves
+
+    def iter_moves(self) -> Iterator[Any]:
+        """
+        Return an iterator over the moves of get_possible_moves(), in any
+        order, so that a search that stops early does not pay for the rest.
+        Subclasses generate the moves lazily where that is cheap, the most
+        promising first.
+
+        Moves may be applied and undone on self between steps of the
+        iterator, as long as self is back in the same position whenever it
+        is advanced.
+        """
+        if self._moves is not None:
+            return iter(self._moves)
+        return iter(self.get_possible_moves())
+
+    def is_terminal(self) -> bool:
+        """
+        Return whether the game is over at this state, so no moves are left
+        to make. This is computed with the legal moves, so it is only
+        computed once per state; subclasses that can tell in constant time
+        override it.
+        """
+        return not self.legal_moves()
+
+    def forget_moves(self) -> None:
+        """
+        Discard the cached legal moves, after this state changed in place.
+        """
+        self._moves = None
+        self._move_set = None
+
     def get_current_player_name(self) -> str:
         """
         Return 'p1' if the current player is Player 1, and 'p2' if the current
@@ -55,11 +109,92 @@ class GameState:
         """
         raise NotImplementedError
 
+    def copy(self) -> 'GameState':
+        """
+        Return a copy of this GameState that apply_move and undo_move can
+        modify without affecting this GameState.
+
+        Only needed when IN_PLACE is True.
+        """
+        raise NotImplementedError
+
+    def apply_move(self, move: Any) -> Any:
+        """
+        Apply move to this GameState in place, and return an undo record that
+        undo_move can use to take it back.
+
+        Only needed when IN_PLACE is True.
+        """
+        raise NotImplementedError
+
+    def undo_move(self, undo: Any) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+
+        Only needed when IN_PLACE is True.
+        """
+        raise NotImplementedError
+
+    def move_index(self, move: Any) -> int:
+        """
+        Return the index of move: a small non-negative integer that stands
+        for move in any state of this game, with no two moves sharing one.
+        """
+        raise NotImplementedError
+
+    def index_move(self, index: int) -> Any:
+        """
+        Return the move whose move_index is index.
+        """
+        raise NotImplementedError
+
+    def state_key(self) -> int:
+        """
+        Return a compact key of this state: an integer that identifies the
+        position, including whose turn it is, among the states of the same
+        game (board size, subtraction set, ...).
+        """
+        raise NotImplementedError
+
+    def from_key(self, key: int) -> 'GameState':
+        """
+        Return the state of the same game as this GameState whose state_key
+        is key.
+        """
+        raise NotImplementedError
+
+    def game_args(self) -> Tuple[Any, ...]:
+        """
+        Return the arguments that make type(self) a state of the same game as
+        self (board size, subtraction set, ...), in any position. Together
+        with state_key(), they are all that is pickled of a state.
+        """
+        raise NotImplementedError
+
+    def __reduce_ex__(self, protocol: int) -> Tuple[Any, ...]:
+        """
+        Pickle self as its game_args() and state_key(), rather than all of
+        its attributes, if it has them.
+        """
+        try:
+            return restore_state, (type(self), self.game_args(),
+                                   self.state_key())
+        except NotImplementedError:
+            return super().__reduce_ex__(protocol)
+
     def is_valid_move(self, move: Any) -> bool:
         """
-        Return whether move is a valid move for this GameState.
+        Return whether move is a valid move for this GameState, in constant
+        time once the legal moves are cached.
         """
-        return move in self.get_possible_moves()
+        if self._move_set is None:
+            self._move_set = frozenset(self.legal_moves())
+        try:
+            return move in self._move_set
+        except TypeError:
+            # move is unhashable, so it cannot be a move
+            return False
 
     def __repr__(self) -> Any:
         """
@@ -74,3 +209,97 @@ class GameState:
         player can guarantee from state self.
         """
         raise NotImplementedError
+
+    def child_rough_outcomes(self) -> dict:
+        """
+        Return a dictionary mapping each possible move to the rough_outcome()
+        of the state it leads to, in get_possible_moves() order.
+        """
+        return {move: self.make_move(move).rough_outcome()
+                for move in self.get_possible_moves()}
+
+
+def restore_state(cls: type, args: Tuple[Any, ...], key: int) -> GameState:
+    """
+    Return the state of type cls, of the game set up by args (see
+    game_args), whose state_key is key.
+    """
+    return cls(*args).from_key(key)
+
+
+def encode_states(states: Sequence[GameState]) -> bytes:
+    """
+    Return states, all of the same game, encoded compactly: the game is
+    pickled once, followed by the state_key of each state as a fixed number
+    of bytes.
+
+    >>> from stonehenge import StonehengeCS
+    >>> x = StonehengeCS(True, 2)
+    >>> states = [x.make_move(move) for move in 'ABCDEFG']
+    >>> decode_states(encode_states(states)) == states
+    True
+    """
+    if not states:
+        return pickle.dumps((None, (), 0, b''), pickle.HIGHEST_PROTOCOL)
+    cls = type(states[0])
+    args = states[0].game_args()
+    keys = [x.state_key() for x in states]
+    if any(type(x) is not cls or x.game_args() != args for x in states):
+        raise ValueError('states of different games cannot be encoded '
+                         'together')
+    width = max(1, (max(keys).bit_length() + 7) // 8)
+    return pickle.dumps(
+        (cls, args, width, b''.join(x.to_bytes(width, 'little')
+                                    for x in keys)),
+        pickle.HIGHEST_PROTOCOL)
+
+
+def decode_states(data: bytes) -> List[GameState]:
+    """
+    Return the states encoded in data by encode_states.
+    """
+    cls, args, width, keys = pickle.loads(data)
+    if cls is None:
+        return []
+    template = cls(*args)
+    return [template.from_key(int.from_bytes(keys[i:i + width], 'little'))
+            for i in range(0, len(keys), width)]
+
+
+# Scale of the estimates of rough_outcome(), so that a position that is only
+# estimated to be good (or bad) never looks as good as a certain WIN (or as
+# bad as a certain LOSE)
+ESTIMATE_SCALE = 0.9
+
+
+def estimate_outcome(balance: Any, must_block: Any) -> Any:
+    """
+    Return the rough_outcome() of a position that is not won or lost yet,
+    from balance, in [-1, 1], how far ahead the player to move is. If
+    must_block, the next move has to block a win for the opponent, so the
+    player to move is behind: balance is taken halfway to LOSE.
+
+    balance and must_block may also be NumPy arrays, to estimate a batch of
+    positions at once.
+
+    >>> estimate_outcome(0.5, False)
+    0.45
+    >>> estimate_outcome(0.5, True)
+    -0.225
+    """
+    # (balance - 1) / 2 where must_block, written without a branch
+    return ESTIMATE_SCALE * (balance - must_block * (balance + 1) / 2)
+
+
+def zobrist_keys(count: int, seed: int) -> Tuple[int, ...]:
+    """
+    Return count pseudo-random 64-bit keys for Zobrist hashing. The keys only
+    depend on seed, so hashes agree between runs and between processes.
+
+    >>> zobrist_keys(3, 0) == zobrist_keys(3, 0)
+    True
+    >>> all(0 <= x < 2 ** 64 for x in zobrist_keys(3, 0))
+    True
+    """
+    rng = Random(seed)
+    return tuple(rng.getrandbits(64) for _ in range(count))
@@ -0,0 +1,77 @@
+"""
+Diagnostics of the memory strategies use, measured with tracemalloc.
+
+Run as a script to report the peak memory of each strategy picking the first
+move of a game, for each board size, for example
+
+    python memory_report.py h mi mb md --sizes 1 2 3
+"""
+from typing import List, Tuple
+import argparse
+import time
+import tracemalloc
+from game_interface import (GAME_OPTIONS, new_strategy, playable_games,
+                            usable_strategies)
+
+
+def measure(game_key: str, strategy_key: str,
+            numbers: List[int]) -> Tuple[int, float]:
+    """
+    Return the peak bytes allocated and the seconds taken by strategy
+    usable_strategies[strategy_key] to pick the first move of a new game of
+    playable_games[game_key], set up by numbers (see GAME_OPTIONS).
+
+    >>> peak, seconds = measure('s', 'mi', [10])
+    >>> peak > 0
+    True
+    """
+    game = playable_games[game_key](True, **GAME_OPTIONS[game_key](numbers))
+    strategy = new_strategy(usable_strategies[strategy_key])
+    # load the modules and tables the game only loads on first use (such as
+    # NumPy for Stonehenge), so they are not counted against the strategy
+    game.current_state.child_rough_outcomes()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        strategy(game)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, seconds
+
+
+def report(game_key: str, strategy_keys: List[str],
+           sizes: List[List[int]]) -> List[str]:
+    """
+    Return the lines of a table of the peak memory and time of each strategy
+    in strategy_keys, for each of sizes of playable_games[game_key].
+    """
+    lines = ['{:<12} {:<24} {:>12} {:>10}'.format('size', 'strategy',
+                                                  'peak (KiB)', 'time (s)')]
+    for numbers in sizes:
+        for key in strategy_keys:
+            peak, seconds = measure(game_key, key, numbers)
+            lines.append('{:<12} {:<24} {:>12.1f} {:>10.3f}'.format(
+                ' '.join(str(x) for x in numbers) or '-',
+                usable_strategies.name(key), peak / 1024, seconds))
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('game', choices=list(playable_games))
+    parser.add_argument('strategies', nargs='+',
+                        choices=[x for x in usable_strategies if x != 'i'])
+    parser.add_argument('--sizes', nargs='*', default=[''],
+                        help='numbers setting up each game, such as 3 or '
+                             '"15 15 5"')
+    options = parser.parse_args()
+    # load the strategies first, so that importing them is not counted as
+    # memory used by the first one
+    for strategy_key in options.strategies:
+        usable_strategies[strategy_key]
+    for line in report(options.game, options.strategies,
+                       [[int(x) for x in size.split()]
+                        for size in options.sizes]):
+        print(line)
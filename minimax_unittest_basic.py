@@ -18,6 +18,7 @@ We will NOT test minimax on Chopsticks, and you shouldn't be using the minimax
 strategy with Chopsticks either, unless you handle repeated/looping states.
 """
 
+import random
 import unittest
 from unittest.mock import patch
 import inspect
@@ -26,6 +27,7 @@ import inspect
 from game_interface import playable_games, usable_strategies
 minimax_iterative_strategy = usable_strategies['mi']
 minimax_recursive_strategy = usable_strategies['mr']
+MinimaxSession = usable_strategies['ms']
 StonehengeGame = playable_games['h']
 SubtractSquareGame = playable_games['s']
 
@@ -232,5 +234,72 @@ class MinimaxUnitTests(unittest.TestCase):
                              expected_move, move_chosen, str(new_state)
                          ))
 
+    def test_iterative_agrees_with_recursive_on_random_stonehenge(self):
+        """
+        Test that iterative minimax, which remembers the positions it has
+        scored, scores random Stonehenge positions like recursive minimax.
+        """
+        from strategy import (child_scores, generate_states_score,
+                              max_move_score, search_state)
+        rng = random.Random(0)
+        for _ in range(150):
+            with patch('builtins.input', return_value='2'):
+                game = StonehengeGame(True)
+            for _ in range(rng.randrange(6)):
+                moves = game.current_state.get_possible_moves()
+                if not moves:
+                    break
+                game.current_state = game.current_state.make_move(
+                    rng.choice(moves))
+            state = game.current_state
+            if game.is_over(state):
+                continue
+            expected = child_scores(game, state, max_move_score)
+            game.current_state = state
+            actual = child_scores(game, search_state(state),
+                                  generate_states_score, {})
+            game.current_state = state
+            self.assertEqual(actual, expected,
+                             "Iterative and recursive minimax disagree on\n" +
+                             str(state))
+
+    def test_session_stonehenge_keeps_scores_between_turns(self):
+        """
+        Test that a minimax session picks winning moves, and that after the
+        opponent's reply the position it has to move from is already scored.
+        """
+        with patch('builtins.input', return_value='2'):
+            game = StonehengeGame(True)
+        session = MinimaxSession()
+
+        for move in ['A', 'F']:
+            game.current_state = game.current_state.make_move(
+                game.str_to_move(move))
+            session.advance(game.current_state)
+        for _ in range(2):
+            player = game.current_state.get_current_player_name()
+            move_chosen = session(game)
+            game.current_state = game.current_state.make_move(move_chosen)
+            if game.is_over(game.current_state):
+                self.assertTrue(game.is_winner(player),
+                                "A minimax session should pick a winning move")
+                break
+            self.assertEqual(session.memo.get(
+                game.current_state.state_key()), -1,
+                "A minimax session should pick a winning move")
+            searched = len(session.memo)
+            session.advance(game.current_state)
+            self.assertTrue(0 < len(session.memo) <= searched,
+                            "advance should keep the reachable scores only")
+
+            reply = game.current_state.legal_moves()[0]
+            game.current_state = game.current_state.make_move(reply)
+            session.advance(game.current_state)
+            if game.is_over(game.current_state):
+                break
+            self.assertEqual(session.memo.get(
+                game.current_state.state_key()), 1,
+                "The position after the reply should already be scored")
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,543 @@
+"""
+The m,n,k-game: TicTacToe on a board with m rows and n columns, won by the
+first player to get k marks in a row (for example, Gomoku is 15,15,5).
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+from game_state import estimate_outcome
+from tictactoe import TicTacToe, TicTacToeCS, xd
+
+# Cells within this distance of a mark are the only moves get_possible_moves
+# considers, once there is a mark on the board
+NEAR_RADIUS = 1
+
+
+class MNKBoard:
+    """
+    The static geometry of an m,n,k board, shared by every state on a board of
+    that size. Cell (r, c) is bit r * width + c of a mask, where width is
+    n + 1: the extra column is never used, so that no line wraps around from
+    one row to the next.
+
+    rows - number of rows (m)
+    columns - number of columns (n)
+    k - number of marks in a row needed to win
+    width - bits per row of a mask
+    cells - mask of all the cells of the board
+    directions - bit offsets of the four directions a line can go in
+    near - mask of the cells within NEAR_RADIUS of each cell, by bit
+    """
+    rows: int
+    columns: int
+    k: int
+    width: int
+    cells: int
+    directions: Tuple[int, ...]
+    near: Dict[int, int]
+
+    def __init__(self, m: int, n: int, k: int) -> None:
+        """
+        Initialize the geometry of the board with m rows, n columns and k
+        marks in a row to win.
+
+        >>> b = MNKBoard(3, 3, 3)
+        >>> bin(b.cells)
+        '0b11101110111'
+        >>> bin(b.near[0])
+        '0b110011'
+        """
+        self.rows = m
+        self.columns = n
+        self.k = k
+        self.width = n + 1
+        self.cells = 0
+        for r in range(m):
+            self.cells |= ((1 << n) - 1) << (r * self.width)
+        self.directions = (1, self.width - 1, self.width, self.width + 1)
+        self.near = {}
+        for r in range(m):
+            for c in range(n):
+                mask = 0
+                for i in range(max(0, r - NEAR_RADIUS),
+                               min(m, r + NEAR_RADIUS + 1)):
+                    for j in range(max(0, c - NEAR_RADIUS),
+                                   min(n, c + NEAR_RADIUS + 1)):
+                        mask |= 1 << (i * self.width + j)
+                self.near[r * self.width + c] = mask
+
+    def to_bit(self, move: int) -> int:
+        """
+        Return the bit of the cell numbered move (1 is the top left cell,
+        counting along each row).
+
+        >>> MNKBoard(3, 3, 3).to_bit(4)
+        4
+        """
+        r, c = divmod(move - 1, self.columns)
+        return r * self.width + c
+
+    def to_move(self, bit: int) -> int:
+        """
+        Return the number of the cell at bit.
+
+        >>> MNKBoard(3, 3, 3).to_move(4)
+        4
+        """
+        r, c = divmod(bit, self.width)
+        return r * self.columns + c + 1
+
+    def completing_cells(self, mask: int, empty: int) -> int:
+        """
+        Return the mask of the cells in empty that would complete k in a row
+        together with the cells in mask.
+
+        >>> b = MNKBoard(3, 3, 3)
+        >>> bin(b.completing_cells(0b11, b.cells & ~0b11))
+        '0b100'
+        """
+        result = 0
+        for d in self.directions:
+            for j in range(self.k):
+                # cells that are the j-th of a line of k with the rest in mask
+                cells = empty
+                for i in range(self.k):
+                    if i < j:
+                        cells &= mask << ((j - i) * d)
+                    elif i > j:
+                        cells &= mask >> ((i - j) * d)
+                result |= cells
+        return result
+
+    def window_marks(self, mask: int, blocked: int) -> Tuple[int, int]:
+        """
+        Return the number of lines of k cells with no cell in blocked, and the
+        total number of cells of mask over those lines.
+
+        >>> b = MNKBoard(3, 3, 3)
+        >>> b.window_marks(0b1, 0)
+        (8, 3)
+        >>> b.window_marks(0b1, 0b100000)
+        (4, 2)
+        """
+        open_cells = self.cells & ~blocked
+        lines = marks = 0
+        for d in self.directions:
+            # starting cells of the lines in direction d open to mask
+            starts = open_cells
+            for i in range(1, self.k):
+                starts &= open_cells >> (i * d)
+            lines += bin(starts).count('1')
+            for i in range(self.k):
+                marks += bin(starts & mask >> (i * d)).count('1')
+        return lines, marks
+
+    def run_length(self, mask: int, bit: int) -> int:
+        """
+        Return the length of the longest line of cells of mask through bit.
+
+        >>> MNKBoard(3, 3, 3).run_length(0b10001, 0)
+        2
+        """
+        longest = 0
+        for d in self.directions:
+            length = 1
+            for step in (d, -d):
+                x = bit + step
+                while x >= 0 and mask >> x & 1:
+                    length += 1
+                    x += step
+            longest = max(longest, length)
+        return longest
+
+
+_BOARDS = {}
+
+
+def get_mnk_board(m: int, n: int, k: int) -> MNKBoard:
+    """
+    Return the shared MNKBoard with m rows, n columns and k in a row to win,
+    building it on first use.
+
+    >>> get_mnk_board(15, 15, 5) is get_mnk_board(15, 15, 5)
+    True
+    """
+    if (m, n, k) not in _BOARDS:
+        _BOARDS[(m, n, k)] = MNKBoard(m, n, k)
+    return _BOARDS[(m, n, k)]
+
+
+class MNKGame(TicTacToe):
+    """
+    TicTacToe on an m by n board, won with k marks in a row.
+    """
+
+    def __init__(self, p1_starts: bool,
+                 size: Tuple[int, int, int] = None) -> None:
+        """
+        Initialize this Game, using p1_starts to find who the first player is.
+        The number of rows, columns and marks in a row to win are asked for
+        unless size gives them.
+        """
+        if size is not None:
+            self.current_state = MNKState(p1_starts, *size)
+            return
+        size = input('Enter the number of rows, columns and marks in a row '
+                     'needed to win (for example, 15 15 5): ').split()
+        # the same bounds as game_interface.GAME_OPTIONS['k']
+        while (len(size) != 3 or not all(x.isnumeric() for x in size) or
+               min(int(x) for x in size) < 1 or
+               int(size[2]) > max(int(size[0]), int(size[1]))):
+            size = input('Input is not valid. Try again: ').split()
+        m, n, k = [int(x) for x in size]
+        self.current_state = MNKState(p1_starts, m, n, k)
+
+    def get_instructions(self) -> str:
+        """
+        Return the instructions for this Game.
+        """
+        board = self.current_state.geometry
+        return "Player 1's mark is O and Player 2's mark is X. Players take " \
+               "turns placing their mark in an empty cell, numbered along " \
+               "each row from 1 at the top left (the number of the first " \
+               "cell of each row is shown on its left). First player to get " \
+               "{} of their marks in a row (horizontally, vertically, " \
+               "diagonally) wins the game.".format(board.k)
+
+    def is_over(self, state: 'MNKState') -> bool:
+        """
+        Return whether or not this game is over at state.
+        """
+        return state.is_terminal()
+
+    def is_winner(self, player: str) -> bool:
+        """
+        Return whether player has won the game.
+
+        Precondition: player is 'p1' or 'p2'.
+        """
+        return self.current_state.winner == int(player[1])
+
+    def str_to_move(self, string: str) -> Any:
+        """
+        Return the move that string represents. If string is not a move,
+        return some invalid move.
+        """
+        if not string.strip().isdigit():
+            return -1
+        return int(string.strip())
+
+
+class MNKState(TicTacToeCS):
+    """
+    The state of an m,n,k-game at a certain point in time.
+
+    p1_turn - whether it is p1's turn or not
+    geometry - shared geometry of the board
+    o_mask - cells marked O by p1 (see MNKBoard for the bit of each cell)
+    x_mask - cells marked X by p2
+    near - empty or not, the cells within NEAR_RADIUS of some mark
+    winner - the player (1 or 2) who has k in a row, or 0
+    """
+    __slots__ = ('geometry', 'near', 'winner')
+    geometry: MNKBoard
+    near: int
+    winner: int
+
+    def __init__(self, is_p1_turn: bool, m: int, n: int, k: int) -> None:
+        """
+        Initialize this game state and set the current player based on
+        is_p1_turn.
+
+        >>> x = MNKState(True, 15, 15, 5)
+        >>> x.get_possible_moves()
+        [113]
+        """
+        super().__init__(is_p1_turn)
+        self.geometry = get_mnk_board(m, n, k)
+        self.near = 0
+        self.winner = 0
+
+    @property
+    def board(self) -> List[str]:
+        """
+        Return the mark in each cell ('O', 'X' or ' '), in move order.
+        """
+        geometry = self.geometry
+        return ['O' if self.o_mask >> geometry.to_bit(i) & 1 else
+                'X' if self.x_mask >> geometry.to_bit(i) & 1 else ' '
+                for i in range(1, geometry.rows * geometry.columns + 1)]
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the current state of the game.
+        """
+        geometry = self.geometry
+        board = self.board
+        size = len(str(len(board)))
+        lines = [' ' * (size + 1) + ' '.join(
+            '{:>{}}'.format(c + 1, size) for c in range(geometry.columns))]
+        for r in range(geometry.rows):
+            first = r * geometry.columns
+            cells = board[first:first + geometry.columns]
+            lines.append('{:>{}} '.format(first + 1, size) + ' '.join(
+                ' ' * (size - 1) + (xd(x) if x != ' ' else '.')
+                for x in cells))
+        return '\n'.join(lines)
+
+    def is_terminal(self) -> bool:
+        """
+        Return whether the game is over at this state, in constant time: a
+        player has k in a row (which apply_move records in winner) or the
+        board is full.
+        """
+        return (self.winner != 0 or
+                self.o_mask | self.x_mask == self.geometry.cells)
+
+    def get_possible_moves(self) -> list:
+        """
+        Return the moves worth considering from this state: the empty cells
+        near a mark, with the ones that win for the current player first and
+        the ones that block a win for the opponent next. On an empty board,
+        the only move considered is the centre.
+
+        >>> x = MNKState(True, 3, 3, 3).make_move(1).make_move(5)
+        >>> x.make_move(2).get_possible_moves()[0]
+        3
+        """
+        geometry = self.geometry
+        if self.winner:
+            return []
+        occupied = self.o_mask | self.x_mask
+        if not occupied:
+            return [(geometry.rows // 2) * geometry.columns +
+                    geometry.columns // 2 + 1]
+        empty = self.near & geometry.cells & ~occupied
+        mine, theirs = ((self.o_mask, self.x_mask) if self.p1_turn else
+                        (self.x_mask, self.o_mask))
+        wins = geometry.completing_cells(mine, empty)
+        blocks = geometry.completing_cells(theirs, empty) & ~wins
+        moves = []
+        for mask in (wins, blocks, empty & ~wins & ~blocks):
+            while mask:
+                bit = mask & -mask
+                moves.append(geometry.to_move(bit.bit_length() - 1))
+                mask ^= bit
+        return moves
+
+    def iter_moves(self) -> Iterator[int]:
+        """
+        Return an iterator over the moves of get_possible_moves(), in the
+        same order, only looking for blocking cells once the winning ones
+        have all been tried.
+
+        >>> x = MNKState(True, 3, 3, 3).make_move(1).make_move(5)
+        >>> list(x.make_move(2).iter_moves())[0]
+        3
+        """
+        geometry = self.geometry
+        if self.winner:
+            return
+        occupied = self.o_mask | self.x_mask
+        if not occupied:
+            yield (geometry.rows // 2) * geometry.columns + \
+                geometry.columns // 2 + 1
+            return
+        empty = self.near & geometry.cells & ~occupied
+        mine, theirs = ((self.o_mask, self.x_mask) if self.p1_turn else
+                        (self.x_mask, self.o_mask))
+        wins = geometry.completing_cells(mine, empty)
+        mask = wins
+        while mask:
+            bit = mask & -mask
+            yield geometry.to_move(bit.bit_length() - 1)
+            mask ^= bit
+        blocks = geometry.completing_cells(theirs, empty) & ~wins
+        for mask in (blocks, empty & ~wins & ~blocks):
+            while mask:
+                bit = mask & -mask
+                yield geometry.to_move(bit.bit_length() - 1)
+                mask ^= bit
+
+    def is_valid_move(self, move: Any) -> bool:
+        """
+        Return whether move is a valid move for this GameState: any empty
+        cell, even one get_possible_moves does not consider, while the game
+        is not over.
+
+        >>> MNKState(True, 15, 15, 5).is_valid_move(1)
+        True
+        """
+        geometry = self.geometry
+        if (not isinstance(move, int) or self.winner or
+                not 1 <= move <= geometry.rows * geometry.columns):
+            return False
+        bit = geometry.to_bit(move)
+        return not (self.o_mask | self.x_mask) >> bit & 1
+
+    def rough_outcome(self) -> float:
+        """
+        Return an estimate in interval [LOSE, WIN] of best outcome the current
+        player can guarantee from state self.
+
+        Like TicTacToeCS.rough_outcome, the estimate is exact when the game is
+        over, WIN when k in a row can be completed right away and LOSE when
+        the opponent has two such cells. Otherwise it compares the lines of k
+        cells still open to each player, weighted by the marks in them.
+
+        >>> x = MNKState(True, 3, 3, 3).make_move(1).make_move(4)
+        >>> x.rough_outcome()
+        0.075
+        >>> x.make_move(2).make_move(9).rough_outcome()
+        1
+        """
+        geometry = self.geometry
+        if self.winner:
+            return self.LOSE
+        occupied = self.o_mask | self.x_mask
+        if occupied == geometry.cells:
+            return self.DRAW
+        mine, theirs = ((self.o_mask, self.x_mask) if self.p1_turn else
+                        (self.x_mask, self.o_mask))
+        empty = geometry.cells & ~occupied
+        if geometry.completing_cells(mine, empty):
+            return self.WIN
+        threats = geometry.completing_cells(theirs, empty)
+        if threats & (threats - 1):
+            return self.LOSE
+        lines_mine, marks_mine = geometry.window_marks(mine, theirs)
+        lines_theirs, marks_theirs = geometry.window_marks(theirs, mine)
+        total = geometry.window_marks(0, 0)[0] * geometry.k
+        return estimate_outcome((lines_mine + marks_mine - lines_theirs -
+                                 marks_theirs) / total, bool(threats))
+
+    def copy(self) -> 'MNKState':
+        """
+        Return a copy of self that apply_move and undo_move can modify
+        without affecting self.
+        """
+        new_state = MNKState.__new__(MNKState)
+        new_state.p1_turn = self.p1_turn
+        new_state.geometry = self.geometry
+        new_state.o_mask = self.o_mask
+        new_state.x_mask = self.x_mask
+        new_state.near = self.near
+        new_state.winner = self.winner
+        new_state._moves = self._moves
+        new_state._move_set = self._move_set
+        return new_state
+
+    def apply_move(self, move: int) -> Tuple[int, int, int]:
+        """
+        Apply move to self in place, and return the undo record: the bit of
+        the move and the previous near and winner.
+
+        >>> x = MNKState(True, 3, 3, 3)
+        >>> for move in [1, 4, 2, 5, 3]:
+        ...     undo = x.apply_move(move)
+        >>> x.winner
+        1
+        >>> x.undo_move(undo)
+        >>> x.winner
+        0
+        """
+        geometry = self.geometry
+        bit = geometry.to_bit(move)
+        undo = (bit, self.near, self.winner)
+        self.near |= geometry.near[bit]
+        if self.p1_turn:
+            self.o_mask |= 1 << bit
+            if geometry.run_length(self.o_mask, bit) >= geometry.k:
+                self.winner = 1
+        else:
+            self.x_mask |= 1 << bit
+            if geometry.run_length(self.x_mask, bit) >= geometry.k:
+                self.winner = 2
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+        return undo
+
+    def undo_move(self, undo: Tuple[int, int, int]) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+        """
+        bit, self.near, self.winner = undo
+        self.p1_turn = not self.p1_turn
+        if self.p1_turn:
+            self.o_mask &= ~(1 << bit)
+        else:
+            self.x_mask &= ~(1 << bit)
+        self.forget_moves()
+
+    def game_args(self) -> Tuple[bool, int, int, int]:
+        """
+        Return the arguments that make a state on the same board as self.
+
+        >>> MNKState(True, 15, 15, 5).game_args()
+        (True, 15, 15, 5)
+        """
+        geometry = self.geometry
+        return True, geometry.rows, geometry.columns, geometry.k
+
+    def state_key(self) -> int:
+        """
+        Return whether it is p2's turn, then the cells of p1, then the cells
+        of p2, as the bits of an integer (move_index and index_move are the
+        ones of TicTacToeCS).
+
+        >>> MNKState(False, 3, 3, 3).make_move(1).state_key()
+        8192
+        """
+        size = self.geometry.rows * self.geometry.width
+        return ((self.o_mask | self.x_mask << size) << 1 |
+                (not self.p1_turn))
+
+    def from_key(self, key: int) -> 'MNKState':
+        """
+        Return the state on the same board as self whose state_key is key.
+
+        >>> x = MNKState(True, 4, 4, 3).make_move(6).make_move(7)
+        >>> y = x.make_move(11).make_move(8).make_move(16)
+        >>> z = x.from_key(y.state_key())
+        >>> z == y, z.winner, z.near == y.near
+        (True, 1, True)
+        """
+        geometry = self.geometry
+        size = geometry.rows * geometry.width
+        new_state = MNKState(not key & 1, geometry.rows, geometry.columns,
+                             geometry.k)
+        new_state.o_mask = key >> 1 & ((1 << size) - 1)
+        new_state.x_mask = key >> (size + 1)
+        for player, mask in [(1, new_state.o_mask), (2, new_state.x_mask)]:
+            while mask:
+                bit = (mask & -mask).bit_length() - 1
+                new_state.near |= geometry.near[bit]
+                if geometry.run_length(mask, bit) >= geometry.k:
+                    new_state.winner = player
+                mask &= mask - 1
+        return new_state
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other are the same position.
+
+        >>> x = MNKState(True, 4, 4, 3)
+        >>> x.make_move(1).make_move(2).make_move(3) == \\
+        ...     x.make_move(3).make_move(2).make_move(1)
+        True
+        """
+        return (type(self) is type(other) and
+                self.geometry is other.geometry and
+                super().__eq__(other))
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of self consistent with __eq__.
+        """
+        return hash((self.o_mask, self.x_mask, self.p1_turn))
+
+    def __repr__(self) -> Any:
+        """
+        Return a representation of this state (which can be used for
+        equality testing).
+        """
+        return "P1 Turn: {}\n".format(self.p1_turn) + str(self)
@@ -0,0 +1,248 @@
+"""
+Minimax searched by several processes at once, which share the positions
+they score through one SharedTranspositionTable.
+"""
+from typing import Any, List, Optional, Sequence, Union
+import multiprocessing
+import os
+import time
+import weakref
+from game import Game
+from game_state import GameState, decode_states, encode_states
+from strategy import generate_states_score, return_max_move
+from transposition import SharedTranspositionTable
+
+# Slots of the table shared by the workers of ParallelSearch (24 bytes each)
+TABLE_SLOTS = 1 << 20
+
+# Number of worker processes of ParallelSearch, or None for one per CPU
+WORKERS = None
+
+# Batches of moves sent to each worker per search, so that workers that
+# finish early can take on more
+BATCHES_PER_WORKER = 4
+
+# Share of its time_left a search spends waiting for the workers, keeping
+# the rest to stop them and estimate the moves they did not score
+TIME_SHARE = 0.8
+
+# The table of the current worker process
+_table = None
+
+
+def _use_table(table: SharedTranspositionTable) -> None:
+    """
+    Make table the table of this worker process.
+    """
+    global _table
+    _table = table
+
+
+def _pack(states: List[GameState]) -> Union[bytes, List[GameState]]:
+    """
+    Return states encoded compactly with encode_states, or states itself if
+    they do not support it.
+    """
+    try:
+        return encode_states(states)
+    except NotImplementedError:
+        return states
+
+
+def _score_states(game: Game,
+                  states: Union[bytes, List[GameState]]) -> List[float]:
+    """
+    Return the score of each of states (packed by _pack) of game for the
+    player who moved into it, searching with the table of this worker
+    process.
+    """
+    if isinstance(states, bytes):
+        states = decode_states(states)
+    return [(-1) * generate_states_score(game, state, _table)
+            for state in states]
+
+
+def _shut_down(resources: List[Any]) -> None:
+    """
+    Stop the pool and free the table in resources, the pool (or None) and
+    the table of a ParallelSearch.
+    """
+    pool, table = resources
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+    table.close()
+    table.unlink()
+
+
+class ParallelSearch:
+    """
+    A strategy that searches the moves of a game in a pool of worker
+    processes, which share a SharedTranspositionTable. The pool and the
+    table are made on the first search and kept for the later ones, so later
+    moves neither start processes again nor forget the positions scored.
+
+    Given time_left, a search stops its workers once TIME_SHARE of it is
+    spent, and estimates the moves not scored yet with rough_outcome(); the
+    pool is started again for the next search, but the table is kept.
+
+    A ParallelSearch plays one game at a time: its table is cleared when it
+    is called with a game of another kind or size. Call close() (or use it
+    as a context manager) to shut the pool down before it is garbage
+    collected.
+
+    workers - the number of worker processes, or None for one per CPU
+    slots - the number of slots of the table
+    """
+    workers: Optional[int]
+    slots: int
+
+    def __init__(self, workers: int = WORKERS,
+                 slots: int = TABLE_SLOTS) -> None:
+        """
+        Initialize a ParallelSearch with workers processes sharing a table of
+        slots slots.
+
+        >>> from subtract_square_game import SubtractSquareGame
+        >>> with ParallelSearch(workers=2, slots=1024) as search:
+        ...     first = search(SubtractSquareGame(True, 3))
+        ...     pool = search._resources[0]
+        ...     second = search(SubtractSquareGame(True, 18))
+        ...     first, second in [1, 16], search._resources[0] is pool
+        (1, True, True)
+        """
+        self.workers = workers
+        self.slots = slots
+        # the pool (None until needed) and the table, once made
+        self._resources = None
+        self._finalizer = None
+        self._game = None
+
+    def __reduce__(self) -> tuple:
+        """
+        Pickle the search as its settings only: a copy sent to another
+        process makes its own pool and table.
+        """
+        return ParallelSearch, (self.workers, self.slots)
+
+    def __enter__(self) -> 'ParallelSearch':
+        """
+        Return self, to be closed on exit.
+        """
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """
+        Close the search.
+        """
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes and free the table.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+        self._resources = self._finalizer = None
+
+    def _start(self) -> Any:
+        """
+        Return the pool of workers, making it (and the table) if needed.
+        """
+        if self._resources is None:
+            table = SharedTranspositionTable(self.slots)
+            self._resources = [None, table]
+            self._finalizer = weakref.finalize(self, _shut_down,
+                                               self._resources)
+        if self._resources[0] is None:
+            self._resources[0] = multiprocessing.Pool(
+                self.workers, initializer=_use_table,
+                initargs=(self._resources[1],))
+        return self._resources[0]
+
+    def scores(self, game: Game, time_left: float = None) -> List[float]:
+        """
+        Return the score of each legal move of game, for the current player,
+        searching for at most TIME_SHARE of time_left seconds if it is given.
+
+        >>> from subtract_square_game import SubtractSquareGame
+        >>> with ParallelSearch(workers=2, slots=1024) as search:
+        ...     search.scores(SubtractSquareGame(True, 18)) == [1, -1, -1, 1]
+        True
+        """
+        start = time.perf_counter()
+        state = game.current_state
+        pool = self._start()
+        kind = (type(state), _game_args(state))
+        if kind != self._game:
+            # keys only identify positions within one game
+            self._resources[1].clear()
+            self._game = kind
+        moves = state.legal_moves()
+        children = [state.make_move(move) for move in moves]
+        size = max(1, -(-len(children) // (
+            BATCHES_PER_WORKER * (self.workers or os.cpu_count() or 1))))
+        pending = [pool.apply_async(_score_states,
+                                    (game, _pack(children[i:i + size])))
+                   for i in range(0, len(children), size)]
+        result = []
+        try:
+            for batch in pending:
+                timeout = None
+                if time_left is not None:
+                    timeout = max(0.0, start + TIME_SHARE * time_left -
+                                  time.perf_counter())
+                result.extend(batch.get(timeout))
+        except multiprocessing.TimeoutError:
+            # stop the searches still running, and estimate their moves
+            self._resources[0] = None
+            pool.terminate()
+            pool.join()
+            outcomes = state.child_rough_outcomes()
+            result.extend((-1) * outcomes[move]
+                          for move in moves[len(result):])
+        return result
+
+    def __call__(self, game: Game, time_left: float = None) -> Any:
+        """
+        Return a move for game that maximizes the chances of winning,
+        searching for at most TIME_SHARE of time_left seconds if it is given.
+        """
+        return return_max_move(list(game.current_state.legal_moves()),
+                               self.scores(game, time_left))
+
+
+def _game_args(state: GameState) -> Optional[Sequence[Any]]:
+    """
+    Return the game_args() of state, or None if it does not have them.
+    """
+    try:
+        return state.game_args()
+    except NotImplementedError:
+        return None
+
+
+def parallel_scores(game: Game, workers: int = WORKERS,
+                    slots: int = TABLE_SLOTS) -> List[float]:
+    """
+    Return the score of each legal move of game, for the current player,
+    searching the moves in a pool of workers processes that share a table of
+    slots slots, which are shut down afterwards.
+
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> game = SubtractSquareGame(True, 18)
+    >>> parallel_scores(game, workers=2, slots=1024) == [1, -1, -1, 1]
+    True
+    """
+    with ParallelSearch(workers, slots) as search:
+        return search.scores(game)
+
+
+def parallel_strategy(game: Game) -> Any:
+    """
+    Return a move for game that maximizes the chances of winning, searching
+    the moves in parallel with a pool made for this move only (see
+    ParallelSearch to keep one between moves).
+    """
+    with ParallelSearch() as search:
+        return search(game)
@@ -0,0 +1,204 @@
+"""
+Perft: a census of the game tree below a state, counting the positions at
+each depth.
+
+The counts only depend on the rules, so they check a faster move generator
+against the reference one (compare the counts with and without --in-place),
+and the time taken measures how many nodes per second get_possible_moves and
+make_move (or apply_move) generate.
+
+Run as a script, for example
+
+    python perft.py h 3 --depth 5
+    python perft.py t --depth 9 --in-place --parallel 4
+    python perft.py s 30 --depth 6 --moves 4
+"""
+from typing import Any, List, NamedTuple, Optional, Set
+import argparse
+import concurrent.futures
+import time
+from game import Game
+from game_state import GameState
+
+
+class PerftResult(NamedTuple):
+    """
+    The census of a game tree, by depth (index 0 is the starting state).
+
+    nodes - positions reached at each depth, counting every path to them
+    terminals - positions at each depth where the game is over
+    distinct - different positions at each depth, or an empty list if they
+               were not counted
+    seconds - time taken by the census
+    """
+    nodes: List[int]
+    terminals: List[int]
+    distinct: List[int]
+    seconds: float
+
+    @property
+    def leaves(self) -> int:
+        """
+        Return the number of positions at the deepest depth (the perft
+        number).
+        """
+        return self.nodes[-1]
+
+    def branching_factors(self) -> List[float]:
+        """
+        Return the average number of moves from the positions at each depth
+        but the deepest where the game is not over.
+
+        >>> PerftResult([1, 9, 72], [0, 0, 0], [], 0.0).branching_factors()
+        [9.0, 8.0]
+        """
+        return [self.nodes[d + 1] / max(1, self.nodes[d] - self.terminals[d])
+                for d in range(len(self.nodes) - 1)]
+
+    def transposition_rates(self) -> List[float]:
+        """
+        Return the fraction of positions at each depth that were reached
+        before by another path.
+
+        >>> PerftResult([1, 4], [0, 0], [1, 3], 0.0).transposition_rates()
+        [0.0, 0.25]
+        """
+        return [1 - distinct / nodes
+                for nodes, distinct in zip(self.nodes, self.distinct)]
+
+
+def _census(game: Game, state: GameState, depth: int, in_place: bool,
+            nodes: List[int], terminals: List[int],
+            seen: Optional[List[Set[int]]], ply: int) -> None:
+    """
+    Add the positions from state (at depth ply) down to depth to nodes,
+    terminals and seen.
+    """
+    nodes[ply] += 1
+    if seen is not None:
+        seen[ply].add(state.state_key())
+    if game.is_over(state):
+        terminals[ply] += 1
+        return
+    if ply == depth:
+        return
+    for move in state.get_possible_moves():
+        if in_place:
+            undo = state.apply_move(move)
+            _census(game, state, depth, in_place, nodes, terminals, seen,
+                    ply + 1)
+            state.undo_move(undo)
+        else:
+            _census(game, state.make_move(move), depth, in_place, nodes,
+                    terminals, seen, ply + 1)
+
+
+def _subtree(game: Game, move: Any, depth: int, in_place: bool,
+             count_distinct: bool) -> tuple:
+    """
+    Return the nodes, terminals and sets of positions (or None) at each
+    depth below making move in game, down to depth. This runs in a worker
+    process of perft.
+    """
+    state = game.current_state.make_move(move)
+    nodes = [0] * depth
+    terminals = [0] * depth
+    seen = [set() for _ in range(depth)] if count_distinct else None
+    _census(game, state, depth - 1, in_place, nodes, terminals, seen, 0)
+    return nodes, terminals, seen
+
+
+def perft(game: Game, depth: int, in_place: bool = False,
+          count_distinct: bool = True, workers: int = 0) -> PerftResult:
+    """
+    Return the census of the game tree of game, from game.current_state down
+    to depth moves ahead. With in_place, moves are made with apply_move and
+    undo_move instead of make_move. Distinct positions are counted (by
+    state_key) if count_distinct. The moves from the starting state are
+    searched in workers processes, or in this process if workers is 0.
+
+    >>> from tictactoe import TicTacToe
+    >>> result = perft(TicTacToe(True), 6)
+    >>> result.nodes
+    [1, 9, 72, 504, 3024, 15120, 54720]
+    >>> result.terminals[5], result.distinct[4]
+    (1440, 756)
+    >>> perft(TicTacToe(True), 6, in_place=True, workers=2).nodes[6]
+    54720
+    """
+    start = time.perf_counter()
+    state = game.current_state
+    nodes = [0] * (depth + 1)
+    terminals = [0] * (depth + 1)
+    seen = [set() for _ in range(depth + 1)] if count_distinct else None
+    if workers and depth > 0 and not game.is_over(state):
+        nodes[0] = 1
+        if seen is not None:
+            seen[0].add(state.state_key())
+        moves = state.get_possible_moves()
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            for sub_nodes, sub_terminals, sub_seen in pool.map(
+                    _subtree, [game] * len(moves), moves,
+                    [depth] * len(moves), [in_place] * len(moves),
+                    [count_distinct] * len(moves)):
+                for d in range(depth):
+                    nodes[d + 1] += sub_nodes[d]
+                    terminals[d + 1] += sub_terminals[d]
+                    if seen is not None:
+                        seen[d + 1] |= sub_seen[d]
+    else:
+        if in_place:
+            state = state.copy()
+        _census(game, state, depth, in_place, nodes, terminals, seen, 0)
+    return PerftResult(nodes, terminals,
+                       [len(x) for x in seen] if seen is not None else [],
+                       time.perf_counter() - start)
+
+
+def format_result(result: PerftResult) -> List[str]:
+    """
+    Return the lines of a report of result.
+    """
+    lines = ['{:>5} {:>14} {:>12} {:>12} {:>10} {:>8}'.format(
+        'depth', 'nodes', 'terminal', 'distinct', 'branching', 'transp')]
+    factors = result.branching_factors() + [None]
+    rates = (result.transposition_rates() if result.distinct else
+             [None] * len(result.nodes))
+    for d, nodes in enumerate(result.nodes):
+        lines.append('{:>5} {:>14} {:>12} {:>12} {:>10} {:>8}'.format(
+            d, nodes, result.terminals[d],
+            result.distinct[d] if result.distinct else '-',
+            '-' if factors[d] is None else '{:.2f}'.format(factors[d]),
+            '-' if rates[d] is None else '{:.1%}'.format(rates[d])))
+    total = sum(result.nodes)
+    lines.append('perft({}) = {}: {} nodes in {:.3f}s, {:.0f} nodes/s'.format(
+        len(result.nodes) - 1, result.leaves, total, result.seconds,
+        total / max(result.seconds, 1e-9)))
+    return lines
+
+
+if __name__ == '__main__':
+    from game_interface import GAME_OPTIONS, playable_games
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('game', choices=list(playable_games))
+    parser.add_argument('numbers', nargs='*', type=int,
+                        help='numbers setting up the game (see GAME_OPTIONS)')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--moves', nargs='*', default=[],
+                        help='moves to make before the census')
+    parser.add_argument('--in-place', action='store_true',
+                        help='use apply_move and undo_move')
+    parser.add_argument('--no-distinct', action='store_true',
+                        help='do not count distinct positions')
+    parser.add_argument('--parallel', type=int, default=0, metavar='WORKERS',
+                        help='search the first moves in WORKERS processes')
+    options = parser.parse_args()
+    chosen = playable_games[options.game](
+        True, **GAME_OPTIONS[options.game](options.numbers))
+    for text in options.moves:
+        chosen.current_state = chosen.current_state.make_move(
+            chosen.str_to_move(text))
+    for line in format_result(perft(chosen, options.depth, options.in_place,
+                                    not options.no_distinct,
+                                    options.parallel)):
+        print(line)
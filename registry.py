@@ -0,0 +1,121 @@
+"""
+Registries of games and strategies, which only import an implementation the
+first time it is looked up.
+"""
+from typing import Any, Dict, Iterator, Mapping
+import importlib
+
+
+class Registry(Mapping):
+    """
+    A read-only mapping from keys to implementations (games, strategies, ...)
+    that imports each implementation on first lookup.
+
+    An implementation is given as a 'module:attribute' string, as an
+    already imported object, or as an entry point in group, which is how
+    installed packages add their own: for example, in pyproject.toml,
+
+        [project.entry-points."game_interface.games"]
+        c = "chopsticks:Chopsticks"
+
+    Entry points are only searched for when a key is not one of the targets,
+    or when all the keys are needed.
+
+    group - the entry point group of third-party implementations, or None
+    """
+    group: str
+
+    def __init__(self, targets: Dict[str, Any], group: str = None) -> None:
+        """
+        Initialize this Registry with the implementations targets, by key,
+        plus those in the entry point group.
+
+        >>> r = Registry({'j': 'json:dumps'})
+        >>> r.name('j'), r['j']([1])
+        ('dumps', '[1]')
+        """
+        self.group = group
+        self._targets = dict(targets)
+        self._loaded = {}
+        self._discovered = group is None
+
+    def register(self, key: str, target: Any) -> None:
+        """
+        Register target, an object or a 'module:attribute' string, as the
+        implementation of key.
+        """
+        self._targets[key] = target
+        self._loaded.pop(key, None)
+
+    def _discover(self) -> None:
+        """
+        Add the entry points of group that do not override a target.
+        """
+        if self._discovered:
+            return
+        self._discovered = True
+        from importlib.metadata import entry_points
+        found = entry_points()
+        if hasattr(found, 'select'):
+            found = found.select(group=self.group)
+        else:  # Python < 3.10
+            found = found.get(self.group, [])
+        for entry_point in found:
+            self._targets.setdefault(entry_point.name, entry_point)
+
+    def name(self, key: str) -> str:
+        """
+        Return the name of the implementation of key, without importing it.
+
+        >>> Registry({'j': 'json:dumps'}).name('j')
+        'dumps'
+        """
+        if key not in self._targets:
+            self._discover()
+        target = self._targets[key]
+        if isinstance(target, str):
+            return target.split(':')[-1]
+        if hasattr(target, 'load'):
+            return target.value.split(':')[-1]
+        return target.__name__
+
+    def __getitem__(self, key: str) -> Any:
+        """
+        Return the implementation of key, importing it if needed.
+        """
+        if key not in self._loaded:
+            if key not in self._targets:
+                self._discover()
+            target = self._targets[key]
+            if isinstance(target, str):
+                module, attribute = target.split(':')
+                target = getattr(importlib.import_module(module), attribute)
+            elif hasattr(target, 'load'):
+                target = target.load()
+            self._loaded[key] = target
+        return self._loaded[key]
+
+    def __contains__(self, key: Any) -> bool:
+        """
+        Return whether key has an implementation.
+
+        >>> 'j' in Registry({'j': 'json:dumps'})
+        True
+        """
+        if key not in self._targets:
+            self._discover()
+        return key in self._targets
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Return an iterator over the keys.
+        """
+        self._discover()
+        return iter(list(self._targets))
+
+    def __len__(self) -> int:
+        """
+        Return the number of keys.
+        """
+        self._discover()
+        return len(self._targets)
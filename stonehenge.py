@@ -1,10 +1,14 @@
 """
 stonehenge game
 """
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterator, List, Tuple, Union
 from game import Game
-from game_state import GameState
-from stonehenge_constants import (generate_leylines, LETTERS_ROW, GRIDS)
+from game_state import GameState, estimate_outcome
+from stonehenge_constants import StonehengeBoard, get_board
+
+# Fewest legal moves for which child_rough_outcomes evaluates the children in
+# one NumPy batch; below this, building each child is faster
+BATCH_MIN_MOVES = 8
 
 
 class Stonehenge(Game):
@@ -23,13 +27,22 @@ least half of the cells in a ley-line , then the player captures that \
 ley-line. A ley-line, once claimed, cannot be taken by the other player. \
 The first player to capture at least half of the ley-lines is the winner.'
 
-    def __init__(self, p1_starts: bool) -> None:
+    # Largest side length a player can choose
+    MAX_SIDE_LENGTH = 10
+
+    def __init__(self, p1_starts: bool, side_length: int = None) -> None:
         """
         Initialize this Game, using p1_starts to find who the first player is.
+        The side length of the board is asked for unless side_length is given.
         """
-        n = input('Enter a number between 1 and 5, inclusive: ')
+        if side_length is not None:
+            self.side_length = side_length
+            self.current_state = StonehengeCS(p1_starts, side_length)
+            return
+        n = input('Enter a number between 1 and {}, inclusive: '.format(
+            self.MAX_SIDE_LENGTH))
         # x.isnumeric() checks that x is type int and is non-negative.
-        while not n.isnumeric() or not 1 <= int(n) <= 5:
+        while not n.isnumeric() or not 1 <= int(n) <= self.MAX_SIDE_LENGTH:
             n = input('Input is not valid. Try again: ')
         self.side_length = int(n)
         self.current_state = StonehengeCS(p1_starts, self.side_length)
@@ -44,15 +57,7 @@ The first player to capture at least half of the ley-lines is the winner.'
         """
         Return whether or not this game is over at state.
         """
-        count_1 = 0
-        count_2 = 0
-        for key in state.leylines:
-            count_1 += state.leylines[key].count(1)
-            count_2 += state.leylines[key].count(2)
-        if (count_1 >= (state.side_length + 1) * 3 / 2 or
-                count_2 >= (state.side_length + 1) * 3 / 2):
-            return True
-        return False
+        return state.is_terminal()
 
     def is_winner(self, player: str) -> bool:
         """
@@ -60,15 +65,8 @@ The first player to capture at least half of the ley-lines is the winner.'
 
         Precondition: player is 'p1' or 'p2'.
         """
-        if not self.is_over(self.current_state):
-            return False
-        player_int = int(player[1])
-        count = 0
-        for key in self.current_state.leylines:
-            count += self.current_state.leylines[key].count(player_int)
-        if count >= (self.current_state.side_length + 1) * 3 / 2:
-            return True
-        return False
+        state = self.current_state
+        return state.claimed[int(player[1]) - 1] >= state.win_threshold()
 
     def str_to_move(self, string: str) -> str:
         """
@@ -84,16 +82,32 @@ class StonehengeCS(GameState):
     """
     The state of a game at a certain point in time.
 
+    Only the per-state data lives on the state itself; the topology of the
+    board is a StonehengeBoard shared by every state of the same side length.
+
     p1_turn - whether it is p1's turn
-    side_length - side length of the Stonehenge game
-    leylines_letters - all groups of letters that form leylines
-    leylines - leyline key that responds to each leyline
-    letters - letters at each node
+    board - shared topology of the board
+    cells - player (1 or 2) who claimed each cell (in board.labels order), 0
+            if it has not been claimed yet
+    owners - player who claimed each leyline (in board.leylines order), 0 if
+             it has not been claimed yet
+    counts - number of cells each player has in each leyline; the count for
+             player p in leyline i is counts[2 * i + p - 1]
+    claimed - number of leylines claimed by each player (1 and 2)
+    free - indices of the cells that have not been claimed yet
+    zobrist - Zobrist hash of the claimed cells, the owners of the leylines
+              and the current player
     """
-    side_length: int
-    leylines_letters: Dict[str, List[List[Union[int, str]]]]
-    leylines: Dict[str, List[Union[int, str]]]
-    letters: List[Union[str, int]]
+    IN_PLACE = True
+    __slots__ = ('p1_turn', 'board', 'cells', 'owners', 'counts', 'claimed',
+                 'free', 'zobrist')
+    board: StonehengeBoard
+    cells: List[int]
+    owners: List[int]
+    counts: List[int]
+    claimed: List[int]
+    free: List[int]
+    zobrist: int
 
     def __init__(self, is_p1_turn: bool, n: int) -> None:
         """
@@ -105,17 +119,38 @@ class StonehengeCS(GameState):
         True
         """
         super().__init__(is_p1_turn)
-        self.side_length = n
-        ley = generate_leylines(n)
-        self.leylines_letters = ley[0]
-        self.leylines = ley[1]
-        self.letters = [x for x in LETTERS_ROW[:(n + 1) * (n + 2) // 2 - 1 + n]]
+        self.board = get_board(n)
+        self.cells = [0 for _ in self.board.labels]
+        self.owners = [0 for _ in self.board.leylines]
+        self.counts = [0 for _ in range(2 * len(self.board.leylines))]
+        self.claimed = [0, 0]
+        self.free = list(range(len(self.cells)))
+        self.zobrist = 0 if is_p1_turn else self.board.zobrist[-1]
+
+    @property
+    def side_length(self) -> int:
+        """
+        Return the side length of the board of this state.
+        """
+        return self.board.side_length
+
+    @property
+    def leylines(self) -> Dict[str, List[Union[int, str]]]:
+        """
+        Return the leyline markers of this state keyed by direction.
+
+        >>> StonehengeCS(True, 1).make_move('A').leylines
+        {'r': [1, '@'], 't': ['@', 1], 'b': [1, '@']}
+        """
+        return self.board.leyline_dict([x or '@' for x in self.owners])
 
     def __str__(self) -> str:
         """
         Return a string representation of self.
         """
-        return GRIDS[self.side_length - 1].format(self.leylines, self.letters)
+        labels = self.board.labels
+        return self.board.template.format(
+            self.leylines, [x or labels[i] for i, x in enumerate(self.cells)])
 
     def get_possible_moves(self) -> list:
         """
@@ -124,15 +159,80 @@ class StonehengeCS(GameState):
         >>> StonehengeCS(True, 1).get_possible_moves()
         ['A', 'B', 'C']
         """
-        count_1 = 0
-        count_2 = 0
-        for key in self.leylines:
-            count_1 += self.leylines[key].count(1)
-            count_2 += self.leylines[key].count(2)
-        if (count_1 >= (self.side_length + 1) * 3 / 2 or
-                count_2 >= (self.side_length + 1) * 3 / 2):
+        if self.is_game_over():
             return []
-        return [x for x in self.letters if str(x).isalpha()]
+        labels = self.board.labels
+        return [labels[i] for i in self.free]
+
+    def iter_moves(self) -> Iterator[str]:
+        """
+        Return an iterator over the moves of get_possible_moves(): first the
+        cells that claim leylines for the current player (most first), then
+        the ones that would claim leylines for the opponent, then the rest.
+
+        >>> x = StonehengeCS(True, 2).make_move('A').make_move('B')
+        >>> list(x.iter_moves())[:2]
+        ['G', 'F']
+        >>> sorted(x.iter_moves()) == sorted(x.get_possible_moves())
+        True
+        """
+        if self.is_game_over():
+            return
+        labels = self.board.labels
+        gains = self._claim_gains()
+        mine, theirs = gains if self.p1_turn else gains[::-1]
+        for cell in sorted(mine, key=mine.get, reverse=True):
+            yield labels[cell]
+        for cell in sorted(theirs, key=theirs.get, reverse=True):
+            if cell not in mine:
+                yield labels[cell]
+        for cell in self.free:
+            if cell not in mine and cell not in theirs:
+                yield labels[cell]
+
+    def win_threshold(self) -> float:
+        """
+        Return the number of leylines a player needs to claim to win.
+
+        >>> StonehengeCS(True, 2).win_threshold()
+        4.5
+        """
+        return self.board.win_threshold
+
+    def is_game_over(self) -> bool:
+        """
+        Return whether either player has claimed enough leylines to win.
+
+        >>> StonehengeCS(True, 1).make_move('A').is_game_over()
+        True
+        """
+        return max(self.claimed) >= self.board.win_threshold
+
+    def is_terminal(self) -> bool:
+        """
+        Return whether the game is over at self, in constant time: the game
+        ends as soon as a player claims enough leylines.
+        """
+        return self.is_game_over()
+
+    def copy(self) -> 'StonehengeCS':
+        """
+        Return a copy of self that shares the board but none of the lists
+        that apply_move modifies.
+        """
+        new_state = StonehengeCS.__new__(StonehengeCS)
+        new_state.p1_turn = self.p1_turn
+        new_state.board = self.board
+        new_state.cells = self.cells[:]
+        new_state.owners = self.owners[:]
+        new_state.counts = self.counts[:]
+        new_state.claimed = self.claimed[:]
+        # apply_move replaces free rather than modifying it
+        new_state.free = self.free
+        new_state.zobrist = self.zobrist
+        new_state._moves = self._moves
+        new_state._move_set = self._move_set
+        return new_state
 
     def make_move(self, move: str) -> 'StonehengeCS':
         """
@@ -143,36 +243,184 @@ class StonehengeCS(GameState):
         >>> y.leylines
         {'r': [1, '@'], 't': ['@', 1], 'b': [1, '@']}
         """
-        current_player = self.get_current_player_name()
-        # make new state and change current player
-        new_state = StonehengeCS(not self.p1_turn, self.side_length)
-        # change state.letters
-        new_state.letters = self.letters[:]
-        new_state.letters[new_state.letters.index(move)] = \
-            int(current_player[1])
-
-        # make a copy of self.leylines_letters
-        for key in self.leylines_letters:
-            new_state.leylines_letters[key] = list([list(x) for x in
-                                                    self.leylines_letters[key]])
-            new_state.leylines[key] = list(self.leylines[key])
-
-        # change state.leylines_letters
-            for elem in new_state.leylines_letters[key]:
-                for i in range(len(elem)):
-                    elem[i] = int(current_player[1]) if elem[i] == move \
-                        else elem[i]
-
-        # check if more than half a leyline is claimed by a player to change
-        # state.leyline
-            for i in range(len(new_state.leylines_letters[key])):
-                n = len(new_state.leylines_letters[key][i]) / 2
-                count_player = int(current_player[1])
-                if (new_state.leylines_letters[key][i].count(count_player) >= n
-                        and new_state.leylines[key][i] == '@'):
-                    new_state.leylines[key][i] = count_player
+        new_state = self.copy()
+        new_state.apply_move(move)
         return new_state
 
+    def apply_move(self, move: str) -> Tuple[int, List[int], List[int], int]:
+        """
+        Apply move to self in place, and return an undo record: the cell
+        claimed, the previous free cells, the leylines claimed and the previous
+        Zobrist hash.
+
+        >>> x = StonehengeCS(True, 2)
+        >>> undo = x.apply_move('A')
+        >>> x.get_possible_moves()
+        ['B', 'C', 'D', 'E', 'F', 'G']
+        >>> x.undo_move(undo)
+        >>> x == StonehengeCS(True, 2)
+        True
+        """
+        player = 1 if self.p1_turn else 2
+        board = self.board
+        cell = board.positions[move]
+        undo = (cell, self.free, [], self.zobrist)
+        self.p1_turn = not self.p1_turn
+        self.cells[cell] = player
+        self.free = [x for x in self.free if x != cell]
+        self.zobrist ^= (board.zobrist[2 * cell + player - 1] ^
+                         board.zobrist[-1])
+        self.forget_moves()
+
+        # only the (at most three) leylines containing move can change
+        for i in board.cell_leylines[cell]:
+            self.counts[2 * i + player - 1] += 1
+            if (not self.owners[i] and
+                    self.counts[2 * i + player - 1] >= board.thresholds[i]):
+                self.owners[i] = player
+                self.claimed[player - 1] += 1
+                self.zobrist ^= board.owner_zobrist[2 * i + player - 1]
+                undo[2].append(i)
+        return undo
+
+    def undo_move(self, undo: Tuple[int, List[int], List[int], int]) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+        """
+        cell, free, claimed, zobrist = undo
+        player = self.cells[cell]
+        self.p1_turn = not self.p1_turn
+        self.cells[cell] = 0
+        self.free = free
+        self.zobrist = zobrist
+        self.forget_moves()
+        for i in self.board.cell_leylines[cell]:
+            self.counts[2 * i + player - 1] -= 1
+        for i in claimed:
+            self.owners[i] = 0
+        self.claimed[player - 1] -= len(claimed)
+
+    def game_args(self) -> Tuple[bool, int]:
+        """
+        Return the arguments that make a state on the same board as self.
+
+        >>> import pickle
+        >>> x = StonehengeCS(True, 5).make_move('A')
+        >>> y = pickle.loads(pickle.dumps(x))
+        >>> y == x, hash(y) == hash(x), len(pickle.dumps(x)) < 100
+        (True, True, True)
+        """
+        return True, self.board.side_length
+
+    def move_index(self, move: str) -> int:
+        """
+        Return the index of move: the index of its cell.
+
+        >>> StonehengeCS(True, 2).move_index('C')
+        2
+        """
+        return self.board.positions[move]
+
+    def index_move(self, index: int) -> str:
+        """
+        Return the move whose move_index is index.
+
+        >>> StonehengeCS(True, 2).index_move(2)
+        'C'
+        """
+        return self.board.labels[index]
+
+    def state_key(self) -> int:
+        """
+        Return the owner of each cell and then of each leyline (0 if
+        unclaimed) as the digits of a base 3 integer, times 2, plus 1 if it
+        is p2's turn. The owners of the leylines are part of the key, since a
+        leyline both players have enough cells in belongs to whoever got
+        there first.
+
+        >>> StonehengeCS(False, 1).make_move('A').state_key()
+        27264
+        """
+        key = 0
+        for x in self.cells:
+            key = key * 3 + x
+        for x in self.owners:
+            key = key * 3 + x
+        return key * 2 + (not self.p1_turn)
+
+    def from_key(self, key: int) -> 'StonehengeCS':
+        """
+        Return the state on the same board as self whose state_key is key.
+
+        >>> x = StonehengeCS(True, 2).make_move('A').make_move('G')
+        >>> y = x.from_key(x.state_key())
+        >>> y == x, hash(y) == hash(x), y.counts == x.counts
+        (True, True, True)
+        """
+        board = self.board
+        new_state = StonehengeCS(not key & 1, board.side_length)
+        key >>= 1
+        for i in reversed(range(len(board.leylines))):
+            key, new_state.owners[i] = divmod(key, 3)
+            if new_state.owners[i]:
+                new_state.claimed[new_state.owners[i] - 1] += 1
+                new_state.zobrist ^= board.owner_zobrist[
+                    2 * i + new_state.owners[i] - 1]
+        for i in reversed(range(len(board.labels))):
+            key, player = divmod(key, 3)
+            if player:
+                new_state.cells[i] = player
+                new_state.zobrist ^= board.zobrist[2 * i + player - 1]
+                for j in board.cell_leylines[i]:
+                    new_state.counts[2 * j + player - 1] += 1
+        new_state.free = [i for i, x in enumerate(new_state.cells) if not x]
+        return new_state
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other are the same position.
+
+        >>> x = StonehengeCS(True, 2)
+        >>> x.make_move('A').make_move('D').make_move('C') == \\
+        ...     x.make_move('C').make_move('D').make_move('A')
+        True
+        >>> x.make_move('A').make_move('B') == x.make_move('B').make_move('A')
+        False
+
+        The same cells can be claimed with a leyline owned by different
+        players, depending on who reached it first:
+
+        >>> y = x.make_move('A').make_move('B').make_move('C')
+        >>> z = x.make_move('C').make_move('B').make_move('A')
+        >>> y.cells == z.cells, y == z, hash(y) == hash(z)
+        (True, False, False)
+        """
+        return (type(self) is type(other) and
+                self.zobrist == other.zobrist and
+                self.p1_turn == other.p1_turn and
+                self.board is other.board and
+                self.cells == other.cells and
+                self.owners == other.owners)
+
+    def __hash__(self) -> int:
+        """
+        Return the Zobrist hash of self.
+
+        No two positions reachable on a board of side length 2 share a hash:
+
+        >>> seen, todo = set(), [StonehengeCS(True, 2)]
+        >>> while todo:
+        ...     state = todo.pop()
+        ...     if state not in seen:
+        ...         seen.add(state)
+        ...         todo.extend(state.make_move(move)
+        ...                     for move in state.get_possible_moves())
+        >>> len(seen), len({hash(state) for state in seen})
+        (2135, 2135)
+        """
+        return self.zobrist
+
     def __repr__(self) -> Any:
         """
         Return a representation of this state (which can be used for
@@ -185,17 +433,80 @@ class StonehengeCS(GameState):
         Return an estimate in interval [LOSE, WIN] of best outcome the current
         player can guarantee from state self.
 
+        The estimate only looks at the per-leyline counts: WIN if the current
+        player can win with one more cell, LOSE if the game is already over or
+        the opponent has several winning cells and the current player cannot
+        claim anything, and otherwise a value strictly between the two that
+        favours the player with more leylines claimed and fewer cells still
+        needed on the open ones.
+
         >>> x = StonehengeCS(True, 1)
         >>> x.rough_outcome()
         1
+        >>> x.make_move('A').rough_outcome()
+        -1
+        >>> y = StonehengeCS(True, 2).make_move('A')
+        >>> -1 < y.rough_outcome() < 0
+        True
         """
-        if any([(not self.make_move(x).get_possible_moves())
-                for x in self.get_possible_moves()]):
+        if self.is_game_over():
+            return self.LOSE
+        me = 0 if self.p1_turn else 1
+        them = 1 - me
+        board = self.board
+        win = board.win_threshold
+        gains = self._claim_gains()
+        if self.claimed[me] + max(gains[me].values(), default=0) >= win:
             return self.WIN
-        else:
-            f_move = [self.make_move(x) for x in self.get_possible_moves()]
-            s_move = [x.make_move(y) for x in f_move
-                      for y in x.get_possible_moves()]
-            if all([(not x.get_possible_moves()) for x in s_move]):
-                return self.LOSE
-            return self.DRAW
+        threats = [x for x in gains[them].values()
+                   if self.claimed[them] + x >= win]
+        if len(threats) > 1 and not gains[me]:
+            return self.LOSE
+
+        # claimed leylines count fully, open ones by the share of the cells
+        # still needed that the opponent needs
+        balance = self.claimed[me] - self.claimed[them]
+        for i, owner in enumerate(self.owners):
+            if not owner:
+                need_me = board.thresholds[i] - self.counts[2 * i + me]
+                need_them = board.thresholds[i] - self.counts[2 * i + them]
+                balance += (need_them - need_me) / (need_me + need_them)
+        return estimate_outcome(balance / len(board.leylines), bool(threats))
+
+    def child_rough_outcomes(self) -> Dict[str, float]:
+        """
+        Return a dictionary mapping each possible move to the rough_outcome()
+        of the state it leads to, in get_possible_moves() order.
+
+        >>> StonehengeCS(True, 1).child_rough_outcomes()
+        {'A': -1, 'B': -1, 'C': -1}
+        """
+        if len(self.free) >= BATCH_MIN_MOVES and not self.is_game_over():
+            # imported here so that NumPy is only loaded once a batch is used
+            import stonehenge_batch
+            if stonehenge_batch.HAVE_NUMPY:
+                return stonehenge_batch.rough_outcomes(self)
+        return super().child_rough_outcomes()
+
+    def _claim_gains(self) -> List[Dict[int, int]]:
+        """
+        Return, for each player (index player - 1), a dictionary mapping the
+        cells that would claim at least one leyline for that player to the
+        number of leylines claimed.
+
+        >>> gains = StonehengeCS(True, 2).make_move('A')._claim_gains()
+        >>> gains[0][6], gains[1][6]
+        (3, 2)
+        """
+        board = self.board
+        gains = [{}, {}]
+        for i, owner in enumerate(self.owners):
+            if owner:
+                continue
+            for player in (0, 1):
+                if self.counts[2 * i + player] + 1 == board.thresholds[i]:
+                    for cell in board.leylines[i]:
+                        if not self.cells[cell]:
+                            gains[player][cell] = \
+                                gains[player].get(cell, 0) + 1
+        return gains
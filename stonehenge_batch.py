@@ -0,0 +1,157 @@
+"""
+Batch expansion of Stonehenge states with NumPy.
+
+Every legal move of a state is applied at once through a cell-by-leyline
+incidence matrix, instead of building one StonehengeCS per move. NumPy is
+optional: when it is not installed, HAVE_NUMPY is False and callers should
+fall back to make_move.
+"""
+from typing import Any, Dict, List, NamedTuple
+from game_state import estimate_outcome
+from stonehenge_constants import StonehengeBoard
+
+try:
+    import numpy
+    HAVE_NUMPY = True
+except ImportError:  # pragma: no cover - depends on the environment
+    numpy = None
+    HAVE_NUMPY = False
+
+
+class BoardArrays(NamedTuple):
+    """
+    The topology of a StonehengeBoard as NumPy arrays.
+
+    incidence - (cells, leylines) matrix, 1 where the cell is in the leyline
+    thresholds - cells needed to claim each leyline
+    """
+    incidence: Any
+    thresholds: Any
+
+
+class ChildBatch(NamedTuple):
+    """
+    All the children of a Stonehenge state, one row per legal move.
+
+    moves - the legal moves, in get_possible_moves order
+    cells - owner of each cell in each child, 0 if unclaimed
+    counts - cells of each player (last axis, p1 then p2) in each leyline
+    owners - owner of each leyline in each child, 0 if unclaimed
+    claimed - leylines newly claimed by the move, as a boolean mask
+    totals - leylines claimed by each player (p1 then p2) in each child
+    terminal - whether the game is over in each child
+    """
+    moves: List[str]
+    cells: Any
+    counts: Any
+    owners: Any
+    claimed: Any
+    totals: Any
+    terminal: Any
+
+
+_ARRAYS = {}
+
+
+def board_arrays(board: StonehengeBoard) -> BoardArrays:
+    """
+    Return the BoardArrays of board, building them on first use.
+
+    >>> from stonehenge_constants import get_board
+    >>> board_arrays(get_board(1)).incidence.tolist()
+    [[1, 0, 0, 1, 1, 0], [1, 0, 1, 0, 0, 1], [0, 1, 1, 0, 1, 0]]
+    """
+    if board.side_length not in _ARRAYS:
+        incidence = numpy.zeros((len(board.labels), len(board.leylines)),
+                                dtype=numpy.int16)
+        for i, leyline in enumerate(board.leylines):
+            incidence[list(leyline), i] = 1
+        _ARRAYS[board.side_length] = BoardArrays(
+            incidence, numpy.array(board.thresholds, dtype=numpy.int16))
+    return _ARRAYS[board.side_length]
+
+
+def expand_children(state: Any) -> ChildBatch:
+    """
+    Return every child of the StonehengeCS state, computed in one batch.
+
+    Precondition: the game is not over at state.
+
+    >>> from stonehenge import StonehengeCS
+    >>> batch = expand_children(StonehengeCS(True, 1))
+    >>> batch.moves
+    ['A', 'B', 'C']
+    >>> batch.totals.tolist()
+    [[3, 0], [3, 0], [3, 0]]
+    >>> batch.terminal.tolist()
+    [True, True, True]
+    """
+    board = state.board
+    arrays = board_arrays(board)
+    player = 0 if state.p1_turn else 1
+    free = numpy.array(state.free, dtype=numpy.intp)
+    rows = numpy.arange(len(free))
+
+    cells = numpy.tile(numpy.array(state.cells, dtype=numpy.int8),
+                       (len(free), 1))
+    cells[rows, free] = player + 1
+    counts = numpy.tile(
+        numpy.array(state.counts, dtype=numpy.int16).reshape(-1, 2),
+        (len(free), 1, 1))
+    counts[:, :, player] += arrays.incidence[free]
+    owners = numpy.tile(numpy.array(state.owners, dtype=numpy.int8),
+                        (len(free), 1))
+    claimed = (owners == 0) & (counts[:, :, player] >= arrays.thresholds)
+    owners[claimed] = player + 1
+    totals = numpy.tile(numpy.array(state.claimed), (len(free), 1))
+    totals[:, player] += claimed.sum(axis=1)
+    terminal = totals.max(axis=1) >= board.win_threshold
+    return ChildBatch([board.labels[i] for i in state.free], cells, counts,
+                      owners, claimed, totals, terminal)
+
+
+def rough_outcomes(state: Any) -> Dict[str, float]:
+    """
+    Return a dictionary mapping each legal move of the StonehengeCS state to
+    the rough_outcome() of the state it leads to, evaluating every child in
+    one batch.
+
+    Precondition: the game is not over at state.
+
+    >>> from stonehenge import StonehengeCS
+    >>> x = StonehengeCS(True, 2).make_move('A')
+    >>> outcomes = rough_outcomes(x)
+    >>> all(abs(outcomes[m] - x.make_move(m).rough_outcome()) < 1e-9
+    ...     for m in x.get_possible_moves())
+    True
+    """
+    batch = expand_children(state)
+    board = state.board
+    arrays = board_arrays(board)
+    win = board.win_threshold
+    # in each child, the player to move is the opponent of state's player
+    me = 1 if state.p1_turn else 0
+    them = 1 - me
+
+    open_ = batch.owners == 0
+    free = batch.cells == 0
+    hot = open_[:, :, None] & (batch.counts + 1 == arrays.thresholds[:, None])
+    # leylines each player would claim with each cell, in each child
+    gains_me = (hot[:, :, me].astype(numpy.int16) @ arrays.incidence.T) * free
+    gains_them = (hot[:, :, them].astype(numpy.int16) @
+                  arrays.incidence.T) * free
+    can_win = batch.totals[:, me] + gains_me.max(axis=1) >= win
+    threats = ((batch.totals[:, them, None] + gains_them >= win) &
+               free).sum(axis=1)
+    lost = (threats > 1) & (gains_me.max(axis=1) == 0)
+
+    need_me = arrays.thresholds - batch.counts[:, :, me]
+    need_them = arrays.thresholds - batch.counts[:, :, them]
+    shares = numpy.where(open_,
+                         (need_them - need_me) /
+                         numpy.maximum(need_me + need_them, 1), 0.0)
+    balance = batch.totals[:, me] - batch.totals[:, them] + shares.sum(axis=1)
+    estimate = estimate_outcome(balance / len(board.leylines), threats > 0)
+    values = numpy.where(batch.terminal | lost, state.LOSE,
+                         numpy.where(can_win, state.WIN, estimate))
+    return {move: value.item() for move, value in zip(batch.moves, values)}
@@ -3,26 +3,44 @@ constants needed for stonehenge module
 """
 
 from typing import Dict, List, Tuple
+from game_state import zobrist_keys
 
 
-LETTERS_ROW = [x for x in 'ABCDEFGHIJKLMNOPQRSTUVWXY']
+LEYLINE_KEYS = ['r', 't', 'b']
 
-LETTERS_T1 = [x for x in 'BCA']
-LETTERS_T2 = [x for x in 'EGBDFAC']
-LETTERS_T3 = [x for x in 'ILEHKBDGJACF']
-LETTERS_T4 = [x for x in 'NRIMQEHLPBDGKOACFJ']
-LETTERS_T5 = [x for x in 'TYNSXIMRWEHLQVBDGKPUACFJO']
 
-LETTERS_TLIST = [LETTERS_T1, LETTERS_T2, LETTERS_T3, LETTERS_T4, LETTERS_T5]
+def cell_labels(count: int) -> List[str]:
+    """
+    Return the labels of count cells: 'A' to 'Z', then 'AA', 'AB', ... like
+    spreadsheet columns.
 
+    >>> cell_labels(3)
+    ['A', 'B', 'C']
+    >>> cell_labels(29)[-4:]
+    ['Z', 'AA', 'AB', 'AC']
+    """
+    labels = []
+    for i in range(count):
+        label = ''
+        i += 1
+        while i > 0:
+            i, rest = divmod(i - 1, 26)
+            label = chr(ord('A') + rest) + label
+        labels.append(label)
+    return labels
 
-LETTERS_B1 = [x for x in 'ACB']
-LETTERS_B2 = [x for x in 'CFADGBE']
-LETTERS_B3 = [x for x in 'FJCGKADHLBEI']
-LETTERS_B4 = [x for x in 'JOFKPCGLQADHMRBEIN']
-LETTERS_B5 = [x for x in 'OUJPVFKQWCGLRXADHMSYBEINT']
 
-LETTERS_BLIST = [LETTERS_B1, LETTERS_B2, LETTERS_B3, LETTERS_B4, LETTERS_B5]
+def cell_coordinates(n: int) -> List[Tuple[int, int]]:
+    """
+    Return the (row, column) of each cell of the board with side length n, in
+    row order. Row r < n has the r + 2 cells in columns 0 to r + 1, and the
+    last row n has the n cells in columns 1 to n.
+
+    >>> cell_coordinates(1)
+    [(0, 0), (0, 1), (1, 1)]
+    """
+    cells = [(r, c) for r in range(n) for c in range(r + 2)]
+    return cells + [(n, c) for c in range(1, n + 1)]
 
 
 def generate_leylines(n: int) -> Tuple[Dict[str, List[object]],
@@ -33,92 +51,255 @@ def generate_leylines(n: int) -> Tuple[Dict[str, List[object]],
     diagonal down to the right) depending on sidelength n. The first dictionary
     is for the letter nodes, while the second is for the leylines.
 
+    A cell in row r and column c is in leyline r of 'r', leyline n - c of 't'
+    and leyline c - r + n - 1 of 'b'.
+
     >>> t = generate_leylines(2)
     >>> all([t[0]['r'][0] == ['A', 'B'], t[1]['r'] == ['@', '@', '@']])
     True
+    >>> t[0]['t']
+    [['E', 'G'], ['B', 'D', 'F'], ['A', 'C']]
     """
-    lists_ = list()
-    lists_.append(LETTERS_ROW)
-    lists_.append(LETTERS_TLIST[n - 1])
-    lists_.append(LETTERS_BLIST[n - 1])
-    total1 = {}
-    total2 = {}
-    total_keys = ['r', 't', 'b']
-    for j in range(3):
-        # letter leylines
-        num_list = [x * (x + 1) // 2 - 1 for x in range(1, n + 2)]
-        letter_list = [[lists_[j][i] for i in range(num_list[k],
-                                                    num_list[k + 1])]
-                       for k in range(len(num_list) - 1)]
-        letter_list.append(
-            [lists_[j][i] for i in range(num_list[-1], num_list[-1] + n)])
-        total1[total_keys[j]] = letter_list
-        # key leylines
-        letter_list = ['@' for _ in range(j * (n + 1), j * (n + 1) + n + 1)]
-        total2[total_keys[j]] = letter_list
+    coordinates = cell_coordinates(n)
+    total1 = {key: [[] for _ in range(n + 1)] for key in LEYLINE_KEYS}
+    total2 = {key: ['@' for _ in range(n + 1)] for key in LEYLINE_KEYS}
+    for label, (r, c) in zip(cell_labels(len(coordinates)), coordinates):
+        total1['r'][r].append(label)
+        total1['t'][n - c].append(label)
+        total1['b'][c - r + n - 1].append(label)
     return (total1, total2)
 
 
-GRID_1 = """      {0[t][1]}   {0[t][0]}
-     /   /
-{0[r][0]} - {1[0]} - {1[1]}
-     \\ / \\
-  {0[r][1]} - {1[2]}   {0[b][1]}
-       \\
-        {0[b][0]}"""
-
-GRID_2 = """        {0[t][2]}   {0[t][1]}
-       /   /
-  {0[r][0]} - {1[0]} - {1[1]}   {0[t][0]}
-     / \\ / \\ /
-{0[r][1]} - {1[2]} - {1[3]} - {1[4]}
-     \\ / \\ / \\
-  {0[r][2]} - {1[5]} - {1[6]}   {0[b][2]}
-       \\   \\
-        {0[b][0]}   {0[b][1]}"""
-
-GRID_3 = """          {0[t][3]}   {0[t][2]}
+def generate_grid(n: int, width: int = 1) -> str:
+    """
+    Return the format string used to draw the board with side length n. It
+    is formatted with the leyline markers keyed by direction ({0}) and the
+    contents of each cell in row order ({1}), each drawn width characters
+    wide (rounded up to an odd number so that the diagonals line up).
+
+    >>> print(generate_grid(1).format(generate_leylines(1)[1], 'ABC'))
+          @   @
          /   /
-    {0[r][0]} - {1[0]} - {1[1]}   {0[t][1]}
-       / \\ / \\ /
-  {0[r][1]} - {1[2]} - {1[3]} - {1[4]}   {0[t][0]}
-     / \\ / \\ / \\ /
-{0[r][2]} - {1[5]} - {1[6]} - {1[7]} - {1[8]}
-     \\ / \\ / \\ / \\
-  {0[r][3]} - {1[9]} - {1[10]} - {1[11]}   {0[b][3]}
-       \\   \\   \\
-        {0[b][0]}   {0[b][1]}   {0[b][2]}"""
-
-GRID_4 = """            {0[t][4]}   {0[t][3]}
-           /   /
-      {0[r][0]} - {1[0]} - {1[1]}   {0[t][2]}
-         / \\ / \\ /
-    {0[r][1]} - {1[2]} - {1[3]} - {1[4]}   {0[t][1]}
-       / \\ / \\ / \\ /
-  {0[r][2]} - {1[5]} - {1[6]} - {1[7]} - {1[8]}   {0[t][0]}
-     / \\ / \\ / \\ / \\ /
-{0[r][3]} - {1[9]} - {1[10]} - {1[11]} - {1[12]} - {1[13]}
-     \\ / \\ / \\ / \\ / \\
-  {0[r][4]} - {1[14]} - {1[15]} - {1[16]} - {1[17]}   {0[b][4]}
-       \\   \\   \\   \\
-        {0[b][0]}   {0[b][1]}   {0[b][2]}   {0[b][3]}
+    @ - A - B
+         \\ / \\
+      @ - C   @
+           \\
+            @
+    """
+    width += 1 - width % 2
+    # distance between cells in a row, and the shift between rows
+    step = width + 3
+    half = step // 2
+    link = (half + 1) // 2
+    middle = (width - 1) // 2
+    field = '{{{}}}' if width == 1 else '{{{}:^%d}}' % width
+    lines = [[] for _ in range(2 * n + 5)]
+
+    def place(line: int, x: int, text: str, size: int = 1) -> None:
+        """
+        Put text, which is drawn size characters wide, at column x of line
+        line.
+        """
+        lines[line].append((x, text, size))
+
+    def place_field(line: int, x: int, name: str) -> None:
+        """
+        Put the field name at column x of line line.
         """
+        place(line, x, field.format(name), width)
 
-GRID_5 = """              {0[t][5]}   {0[t][4]}
-             /   /
-        {0[r][0]} - {1[0]} - {1[1]}   {0[t][3]}
-           / \\ / \\ /
-      {0[r][1]} - {1[2]} - {1[3]} - {1[4]}   {0[t][2]}
-         / \\ / \\ / \\ /
-    {0[r][2]} - {1[5]} - {1[6]} - {1[7]} - {1[8]}   {0[t][1]}
-       / \\ / \\ / \\ / \\ / 
-  {0[r][3]} - {1[9]} - {1[10]} - {1[11]} - {1[12]} - {1[13]}   {0[t][0]}
-     / \\ / \\ / \\ / \\ / \\ / 
-{0[r][4]} - {1[14]} - {1[15]} - {1[16]} - {1[17]} - {1[18]} - {1[19]}
-     \\ / \\ / \\ / \\ / \\ / \\
-  {0[r][5]} - {1[20]} - {1[21]} - {1[22]} - {1[23]} - {1[24]}   {0[b][5]}
-       \\   \\   \\   \\   \\
-        {0[b][0]}   {0[b][1]}   {0[b][2]}   {0[b][3]}   {0[b][4]}
+    def place_row(line: int, x: int, tokens: List[str]) -> List[int]:
         """
+        Put tokens on line line starting at column x, joined by ' - ', and
+        return the centre column of each token.
+        """
+        centres = []
+        for i, token in enumerate(tokens):
+            place_field(line, x + i * step, token)
+            if i < len(tokens) - 1:
+                place(line, x + i * step + width, ' - ', 3)
+            centres.append(x + i * step + middle)
+        return centres
+
+    def cells(first: int, count: int) -> List[str]:
+        """
+        Return the fields of count cells starting at cell index first.
+        """
+        return ['1[{}]'.format(i) for i in range(first, first + count)]
+
+    # top markers of 't' and the links from them to the first row
+    x = half * (n - 1) + step
+    place_field(0, x + half, '0[t][{}]'.format(n))
+    place_field(0, x + half + step, '0[t][{}]'.format(n - 1))
+    place(1, x + middle + link, '/')
+    place(1, x + middle + step + link, '/')
+    first = 0
+    for r in range(n):
+        line = 2 + 2 * r
+        centres = place_row(line, half * (n - 1 - r),
+                            ['0[r][{}]'.format(r)] + cells(first, r + 2))[1:]
+        first += r + 2
+        if r < n - 1:
+            # marker of 't' at the end of the row, then links to next row
+            place_field(line, centres[-1] - middle + step,
+                        '0[t][{}]'.format(n - 2 - r))
+            for i, centre in enumerate(centres + [centres[-1] + step]):
+                if i > 0:
+                    place(line + 1, centre - half - link, '\\')
+                place(line + 1, centre - half + link, '/')
+        else:
+            for i, centre in enumerate(centres):
+                if i > 0:
+                    place(line + 1, centre - link, '/')
+                place(line + 1, centre + link, '\\')
+    # last row, its marker of 'b', then the bottom markers of 'b'
+    line = 2 * n + 2
+    centres = place_row(line, half, ['0[r][{}]'.format(n)] +
+                        cells(first, n))[1:]
+    place_field(line, centres[-1] - middle + step, '0[b][{}]'.format(n))
+    for i, centre in enumerate(centres):
+        place(line + 1, centre + link, '\\')
+        place_field(line + 2, centre - middle + half, '0[b][{}]'.format(i))
+
+    rows = []
+    for tokens in lines:
+        row = ''
+        column = 0
+        for x, text, size in sorted(tokens):
+            row += ' ' * (x - column) + text
+            column = x + size
+        rows.append(row)
+    return '\n'.join(rows)
+
+
+def generate_cell_leylines(n: int) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Return a dictionary mapping each cell letter of the board with side length
+    n to the (direction, index) pairs of the leylines that contain it.
+
+    >>> generate_cell_leylines(1)['A']
+    [('r', 0), ('t', 1), ('b', 0)]
+    """
+    cell_leylines = {}
+    for key, letter_list in generate_leylines(n)[0].items():
+        for i, leyline in enumerate(letter_list):
+            for letter in leyline:
+                cell_leylines.setdefault(letter, []).append((key, i))
+    return cell_leylines
+
+
+def generate_leyline_lengths(n: int) -> Dict[str, List[int]]:
+    """
+    Return the number of cells in each leyline of the board with side
+    length n, for each of the three directions.
 
-GRIDS = [GRID_1, GRID_2, GRID_3, GRID_4, GRID_5]
+    >>> generate_leyline_lengths(2)['t']
+    [2, 3, 2]
+    """
+    return {key: [len(leyline) for leyline in letter_list]
+            for key, letter_list in generate_leylines(n)[0].items()}
+
+
+def generate_claim_thresholds(n: int) -> Dict[str, List[int]]:
+    """
+    Return the number of cells a player needs in each leyline of the board
+    with side length n to claim it (at least half of its cells).
+
+    >>> generate_claim_thresholds(3)['r']
+    [1, 2, 2, 2]
+    """
+    return {key: [(length + 1) // 2 for length in lengths]
+            for key, lengths in generate_leyline_lengths(n).items()}
+
+
+class StonehengeBoard:
+    """
+    The static topology of a Stonehenge board. It is built once per side
+    length (see get_board) and shared by reference between every state on
+    a board of that size, so it must never be modified.
+
+    side_length - side length of the board
+    labels - label of each cell (its move), in row order
+    positions - index of each cell label in labels
+    leylines - cell indices of each leyline; leyline d * (side_length + 1) + i
+               is leyline i in direction LEYLINE_KEYS[d]
+    cell_leylines - indices of the leylines containing each cell
+    thresholds - cells a player needs to claim each leyline
+    win_threshold - leylines a player needs to claim to win
+    template - format string used to render a state on this board
+    zobrist - Zobrist key of player p claiming cell i at index 2 * i + p - 1,
+              followed by the key for p2 being the current player
+    owner_zobrist - Zobrist key of player p owning leyline i at index
+                    2 * i + p - 1
+    """
+    side_length: int
+    labels: Tuple[str, ...]
+    positions: Dict[str, int]
+    leylines: Tuple[Tuple[int, ...], ...]
+    cell_leylines: Tuple[Tuple[int, ...], ...]
+    thresholds: Tuple[int, ...]
+    win_threshold: float
+    template: str
+    zobrist: Tuple[int, ...]
+    owner_zobrist: Tuple[int, ...]
+
+    def __init__(self, n: int) -> None:
+        """
+        Initialize the topology of the board with side length n.
+
+        >>> b = StonehengeBoard(1)
+        >>> b.leylines
+        ((0, 1), (2,), (1, 2), (0,), (0, 2), (1,))
+        >>> b.cell_leylines[0]
+        (0, 3, 4)
+        """
+        self.side_length = n
+        self.labels = tuple(cell_labels((n + 1) * (n + 2) // 2 - 1 + n))
+        self.positions = {x: i for i, x in enumerate(self.labels)}
+        letter_leylines = generate_leylines(n)[0]
+        self.leylines = tuple(tuple(self.positions[x] for x in leyline)
+                              for key in LEYLINE_KEYS
+                              for leyline in letter_leylines[key])
+        cell_leylines = generate_cell_leylines(n)
+        self.cell_leylines = tuple(
+            tuple(LEYLINE_KEYS.index(key) * (n + 1) + i
+                  for key, i in cell_leylines[x])
+            for x in self.labels)
+        thresholds = generate_claim_thresholds(n)
+        self.thresholds = tuple(x for key in LEYLINE_KEYS
+                                for x in thresholds[key])
+        self.win_threshold = len(self.leylines) / 2
+        self.template = generate_grid(n, max(len(x) for x in self.labels))
+        # one stream for both tables, so that no owner key repeats a cell key
+        keys = zobrist_keys(2 * len(self.labels) + 1 +
+                            2 * len(self.leylines), n)
+        self.zobrist = keys[:2 * len(self.labels) + 1]
+        self.owner_zobrist = keys[2 * len(self.labels) + 1:]
+
+    def leyline_dict(self, owners: List[object]) -> Dict[str, List[object]]:
+        """
+        Return the flat list of leyline markers owners split by direction,
+        in the layout used by generate_leylines.
+
+        >>> get_board(1).leyline_dict([1, '@', '@', 1, 2, '@'])
+        {'r': [1, '@'], 't': ['@', 1], 'b': [2, '@']}
+        """
+        size = self.side_length + 1
+        return {key: owners[d * size:(d + 1) * size]
+                for d, key in enumerate(LEYLINE_KEYS)}
+
+
+_BOARDS = {}
+
+
+def get_board(n: int) -> StonehengeBoard:
+    """
+    Return the shared StonehengeBoard with side length n, building it on
+    first use.
+
+    >>> get_board(3) is get_board(3)
+    True
+    """
+    if n not in _BOARDS:
+        _BOARDS[n] = StonehengeBoard(n)
+    return _BOARDS[n]
@@ -6,9 +6,13 @@ Adjust the type annotations as needed, and implement both a recursive
 and an iterative version of minimax.
 """
 
-from typing import Any, List
+from typing import Any, Callable, Dict, List
+from itertools import islice
 from random import choice
+import sys
+import time
 from helper_classes import Tree, Stack
+import tracing
 from game import Game
 from game_state import GameState
 
@@ -21,6 +25,7 @@ def interactive_strategy(game: Game) -> Any:
     return game.str_to_move(move)
 
 
+@tracing.traced()
 def rough_outcome_strategy(game: Game) -> Any:
     """
     Return a move for game by picking a move which results in a state with
@@ -30,13 +35,14 @@ def rough_outcome_strategy(game: Game) -> Any:
     best_move = None
     best_outcome = -2  # Temporarily -- just so we can replace this easily later
 
-    # Get the move that results in the lowest rough_outcome for the opponent
-    for move in current_state.get_possible_moves():
-        new_state = current_state.make_move(move)
-
+    # Get the move that results in the lowest rough_outcome for the opponent,
+    # estimating every child at once
+    with tracing.span('child_rough_outcomes'):
+        outcomes = current_state.child_rough_outcomes()
+    for move in outcomes:
         # We multiply the below by -1 since a state that's bad for the opponent
         # is good for us.
-        guessed_score = new_state.rough_outcome() * -1
+        guessed_score = outcomes[move] * -1
         if guessed_score > best_outcome:
             best_outcome = guessed_score
             best_move = move
@@ -45,52 +51,84 @@ def rough_outcome_strategy(game: Game) -> Any:
     return best_move
 
 
+@tracing.traced()
 def recursive_strategy(game: Game) -> Any:
     """
     Return a move for game that maximizes the chances of winning. This function
     is recursive.
     """
     current_state = game.current_state
-    after_move = [current_state.make_move(x)
-                  for x in current_state.get_possible_moves()]
-    scores = [(-1) * max_move_score(game, x) for x in after_move]
+    moves = current_state.legal_moves()
+    try:
+        scores = child_scores(game, search_state(current_state),
+                              max_move_score, {})
+    except RecursionError:
+        # the game is deeper than Python's recursion limit: search it with
+        # explicit stacks instead
+        game.current_state = current_state
+        return iterative_strategy(game)
     game.current_state = current_state
-    return return_max_move(game.current_state.get_possible_moves(), scores)
+    return return_max_move(moves, scores)
 
 
-def max_move_score(game: Game, state: GameState) -> int:
+def max_move_score(game: Game, state: GameState, memo: dict = None) -> int:
     """
-    Return the score for the given state.
+    Return the score for the given state, remembering the score of every
+    position searched in memo, keyed by its state_key(), so that each
+    position is only searched once.
+
+    >>> from subtract_square_state import SubtractSquareState
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> game = SubtractSquareGame.__new__(SubtractSquareGame)
+    >>> max_move_score(game, SubtractSquareState(True, 200))
+    1
     """
-    if game.is_over(state):
-        game.current_state = state
-        if game.is_winner(game.current_state.get_current_player_name()):
-            return 1
-        elif not game.is_winner(game.current_state.get_current_player_name()):
-            return -1
-        return 0
-    states = [state.make_move(x) for x in state.get_possible_moves()]
-    return max([(-1) * max_move_score(game, x) for x in states])
+    if state.is_terminal():
+        return terminal_score(game, state)
+    if memo is None:
+        memo = {}
+    key = state.state_key()
+    score = memo.get(key)
+    if score is None:
+        score = best_child_score(game, state, max_move_score, memo)
+        memo[key] = score
+    return score
 
 
+@tracing.traced()
 def iterative_strategy(game: Game) -> Any:
     """
     Return a move for game that maximizes the chances of winning. This function
     is iterative.
     """
     current_state = game.current_state
-    after_move = [current_state.make_move(x)
-                  for x in current_state.get_possible_moves()]
-    scores = [(-1) * generate_states_score(game, x)
-              for x in after_move]
+    moves = current_state.legal_moves()
+    scores = child_scores(game, search_state(current_state),
+                          generate_states_score, {})
     game.current_state = current_state
-    return return_max_move(game.current_state.get_possible_moves(), scores)
+    return return_max_move(moves, scores)
 
 
-def generate_states_score(game: Game, state: GameState) -> int:
+def generate_states_score(game: Game, state: GameState,
+                          memo: dict = None, budget: int = None) -> int:
     """
     Return the score for the given state.
+
+    States that support in-place moves are searched by applying and undoing
+    moves on state itself, which is left as it was, remembering the score of
+    each position in memo (see in_place_states_score). Other states are
+    expanded into a Tree, releasing each subtree once it is scored, and
+    MemoryBudgetExceeded is raised if the nodes alive at once would take more
+    than about budget bytes.
     """
+    if state.IN_PLACE:
+        if tracing.ACTIVE:
+            memo = CountingMemo({} if memo is None else memo)
+            with tracing.span('in_place_states_score', memo=memo.counts):
+                return in_place_states_score(game, state, memo)
+        return in_place_states_score(game, state, memo)
+    node_bytes = approx_bytes(Tree(state)) + approx_bytes(state)
+    alive = 1
     s = Stack()
     t = Tree(state)
     s.add(t)
@@ -98,19 +136,16 @@ def generate_states_score(game: Game, state: GameState) -> int:
         current_node = s.remove()
         current_state = current_node.value
         # assign score to states that are already over
-        if game.is_over(current_state):
-            game.current_state = current_state
-            if game.is_winner(current_state.get_current_player_name()):
-                current_node.score = 1
-            elif not game.is_winner(current_state.get_current_player_name()):
-                current_node.score = -1
-            else:
-                current_node.score = 0
+        if current_state.is_terminal():
+            current_node.score = terminal_score(game, current_state)
         elif not current_node.children:
             # state not visited yet
             after_move = [Tree(current_state.make_move(x)) for x in
                           current_state.get_possible_moves()]
             current_node.children = after_move[:]
+            alive += len(after_move)
+            if budget is not None and alive * node_bytes > budget:
+                raise MemoryBudgetExceeded
             s.add(current_node)
             for c in after_move:
                 s.add(c)
@@ -119,9 +154,489 @@ def generate_states_score(game: Game, state: GameState) -> int:
             # and add to list_
             current_node.score = max([(-1) * x.score
                                       for x in current_node.children])
+            # only the score of a scored node is needed from now on
+            alive -= len(current_node.children)
+            current_node.children = []
     return t.score
 
 
+def in_place_states_score(game: Game, state: GameState,
+                          memo: dict = None) -> int:
+    """
+    Return the score for the given state, which supports in-place moves,
+    without recursion or building new states.
+
+    The score of every position searched is stored in memo, keyed by its
+    state_key(), and each position is only searched once, so the work and
+    memory needed grow with the number of distinct positions rather than the
+    number of paths to them. memo is a new dict if it is None, or anything
+    with get and item assignment, such as a SharedTranspositionTable. The
+    search stops looking at the moves from a position once one of them wins,
+    and since the moves come from iter_moves(), the rest are not generated.
+
+    >>> from subtract_square_state import SubtractSquareState
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> game = SubtractSquareGame.__new__(SubtractSquareGame)
+    >>> in_place_states_score(game, SubtractSquareState(True, 2015))
+    -1
+    """
+    if state.is_terminal():
+        return terminal_score(game, state)
+    if memo is None:
+        memo = {}
+    score = memo.get(state.state_key())
+    if score is not None:
+        return score
+    # each frame holds an iterator over the moves from a state not tried
+    # yet, the best score so far, and the undo record of the last move tried
+    s = Stack()
+    s.add([state.iter_moves(), -1, None])
+    score = None
+    while not s.is_empty():
+        frame = s.remove()
+        if score is not None:
+            # the last move tried from frame has been scored: take it back
+            state.undo_move(frame[2])
+            frame[1] = max(frame[1], (-1) * score)
+            score = None
+        move = _NO_MOVE if frame[1] == 1 else next(frame[0], _NO_MOVE)
+        if move is _NO_MOVE:
+            score = frame[1]
+            memo[state.state_key()] = score
+        else:
+            frame[2] = state.apply_move(move)
+            s.add(frame)
+            if state.is_terminal():
+                score = terminal_score(game, state)
+            else:
+                # memo may be shared with other processes (see
+                # transposition.py), so it is probed once rather than
+                # checked and then read
+                score = memo.get(state.state_key())
+                if score is None:
+                    s.add([state.iter_moves(), -1, None])
+    return score
+
+
+# Returned by next() when the moves of a frame of in_place_states_score run
+# out (None could be a move)
+_NO_MOVE = object()
+
+
+class SearchSession:
+    """
+    A strategy that searches the game to the end like iterative_strategy,
+    but keeps the scores it found from one turn to the next, and plays the
+    first winning move it finds. The position after the opponent's reply is
+    usually one the last search reached, so later moves reuse most of the
+    work of the first.
+
+    A SearchSession plays one game. Call it with the game to pick a move,
+    and call advance with each new state once a move is made, which forgets
+    the positions that can no longer be reached. GameInterface makes a new
+    SearchSession for each player and calls advance for it.
+
+    memo - the score of each position searched and still reachable, by
+           state_key() (see in_place_states_score)
+    """
+    memo: Dict[int, int]
+
+    def __init__(self) -> None:
+        """
+        Initialize a SearchSession that has searched nothing yet.
+
+        >>> from subtract_square_game import SubtractSquareGame
+        >>> game = SubtractSquareGame(True, 18)
+        >>> session = SearchSession()
+        >>> session(game)
+        1
+        >>> game.current_state = game.current_state.make_move(16)
+        >>> session.advance(game.current_state)
+        >>> sorted(session.memo)
+        [2, 5]
+        """
+        self.memo = {}
+
+    def __call__(self, game: Game) -> Any:
+        """
+        Return a move for game that maximizes the chances of winning.
+        """
+        with tracing.span('SearchSession', 'strategy',
+                          positions=len(self.memo)):
+            current_state = game.current_state
+            state = search_state(current_state)
+            best_move, best = None, -2
+            # stop at the first winning move: when the last search found
+            # this position to be a win, the move is usually already in memo
+            for move in state.iter_moves():
+                if state.IN_PLACE:
+                    undo = state.apply_move(move)
+                    score = (-1) * generate_states_score(game, state,
+                                                         self.memo)
+                    state.undo_move(undo)
+                else:
+                    score = (-1) * generate_states_score(
+                        game, state.make_move(move))
+                if score > best:
+                    best_move, best = move, score
+                    if best == 1:
+                        break
+            game.current_state = current_state
+            return best_move
+
+    def advance(self, state: GameState) -> None:
+        """
+        Forget the positions that cannot be reached from state, the new
+        state of the game.
+
+        Only positions reached through the positions kept are kept: the
+        others may still be reachable, but are searched again if needed.
+        """
+        memo = self.memo
+        kept = {}
+        if not state.IN_PLACE or state.state_key() not in memo:
+            self.memo = kept
+            return
+        state = state.copy()
+        kept[state.state_key()] = memo[state.state_key()]
+        # each frame holds an iterator over the moves from a position kept
+        # not tried yet, and the undo record of the last move tried
+        s = Stack()
+        s.add([state.iter_moves(), None])
+        while not s.is_empty():
+            frame = s.remove()
+            if frame[1] is not None:
+                state.undo_move(frame[1])
+                frame[1] = None
+            move = next(frame[0], _NO_MOVE)
+            if move is not _NO_MOVE:
+                frame[1] = state.apply_move(move)
+                s.add(frame)
+                key = state.state_key()
+                if key in memo and key not in kept:
+                    kept[key] = memo[key]
+                    s.add([state.iter_moves(), None])
+        self.memo = kept
+
+
+# Number of moves depth_limited_strategy looks ahead before falling back to
+# rough_outcome()
+SEARCH_DEPTH = 3
+
+# Default memory budget of budgeted_strategy, in bytes
+MEMORY_BUDGET = 64 * 2 ** 20
+
+# Approximate bytes a memo entry takes besides its key: its value and its
+# share of the dict's table
+MEMO_ENTRY_BYTES = 64
+
+# Times its capacity a BoundedMemo evicts before its search gives up
+EVICTION_PATIENCE = 4
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised by a search that cannot go on within its memory budget.
+    """
+
+
+def approx_bytes(obj: Any) -> int:
+    """
+    Return the approximate bytes taken by obj and the containers it holds
+    directly (in its attributes or slots), but not the objects they share.
+
+    >>> approx_bytes([1, 2]) == sys.getsizeof([1, 2])
+    True
+    """
+    size = sys.getsizeof(obj)
+    names = list(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        names.extend(getattr(cls, '__slots__', ()))
+    for name in names:
+        value = getattr(obj, name, None)
+        if isinstance(value, (list, dict, tuple, set, frozenset)):
+            size += sys.getsizeof(value)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+class BoundedMemo(dict):
+    """
+    A memo for in_place_states_score that keeps its approximate size under a
+    budget by evicting its oldest entries, a quarter at a time. Evicted
+    positions are searched again if they are reached again; once that has
+    happened for EVICTION_PATIENCE times as many entries as the memo holds,
+    the search is hopeless within the budget and MemoryBudgetExceeded is
+    raised.
+
+    budget - bytes the memo may take
+    size - approximate bytes taken
+    evicted - number of entries evicted so far
+    """
+    budget: int
+    size: int
+    evicted: int
+
+    def __init__(self, budget: int) -> None:
+        """
+        Initialize an empty memo that may take budget bytes.
+
+        >>> memo = BoundedMemo(100 * (MEMO_ENTRY_BYTES + sys.getsizeof(1)))
+        >>> for i in range(150):
+        ...     memo[i] = 1
+        >>> len(memo), memo.evicted, memo.get(0), memo.get(149)
+        (100, 50, None, 1)
+        """
+        super().__init__()
+        self.budget = budget
+        self.size = 0
+        self.evicted = 0
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        """
+        Remember value for key, evicting old entries if the budget is used
+        up.
+        """
+        if key not in self:
+            self.size += sys.getsizeof(key) + MEMO_ENTRY_BYTES
+        super().__setitem__(key, value)
+        if self.size > self.budget:
+            for old in list(islice(self, max(1, len(self) // 4))):
+                self.size -= sys.getsizeof(old) + MEMO_ENTRY_BYTES
+                del self[old]
+                self.evicted += 1
+            if self.evicted > EVICTION_PATIENCE * max(1, len(self)):
+                raise MemoryBudgetExceeded
+
+
+@tracing.traced()
+def budgeted_strategy(game: Game, memory_budget: int = MEMORY_BUDGET) -> Any:
+    """
+    Return a move for game that maximizes the chances of winning, searching
+    with about memory_budget bytes of memory for the memo or tree.
+
+    The moves are searched to the end of the game while the budget allows,
+    evicting old memo entries as needed, until one of them wins. If that is
+    hopeless, the moves not scored yet are estimated with rough_outcome()
+    instead (in one batch, so giving up stays cheap), and the best of all
+    the scores so far is picked.
+
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> budgeted_strategy(SubtractSquareGame(True, 20000), 10 ** 5) > 0
+    True
+    """
+    current_state = game.current_state
+    moves = current_state.legal_moves()
+    memo = BoundedMemo(memory_budget)
+    scores = []
+    try:
+        for move in moves:
+            scores.append((-1) * generate_states_score(
+                game, current_state.make_move(move), memo, memory_budget))
+            if scores[-1] == 1:
+                moves = moves[:len(scores)]
+                break
+    except MemoryBudgetExceeded:
+        memo.clear()
+        outcomes = current_state.child_rough_outcomes()
+        scores.extend((-1) * outcomes[move] for move in moves[len(scores):])
+    game.current_state = current_state
+    return return_max_move(moves, scores)
+
+
+@tracing.traced()
+def depth_limited_strategy(game: Game, time_left: float = None) -> Any:
+    """
+    Return a move for game that maximizes the chances of winning, looking at
+    most SEARCH_DEPTH moves ahead and estimating the states beyond that with
+    rough_outcome().
+
+    If time_left (in seconds) is given, the search looks 1, 2, ... moves
+    ahead in turn, and stops deepening when the next depth is not expected to
+    finish in time: each depth is assumed to take as many times longer than
+    the last as there are moves from the current state.
+    """
+    current_state = game.current_state
+    moves = current_state.legal_moves()
+    start = time.perf_counter()
+    depth = SEARCH_DEPTH if time_left is None else 1
+    while True:
+        begin = time.perf_counter()
+        scores = child_scores(game, search_state(current_state),
+                              limited_move_score, depth - 1)
+        game.current_state = current_state
+        now = time.perf_counter()
+        if (depth >= SEARCH_DEPTH or
+                now - start + (now - begin) * len(moves) > time_left):
+            return return_max_move(moves, scores)
+        depth += 1
+
+
+def limited_move_score(game: Game, state: GameState, depth: int) -> float:
+    """
+    Return the score for the given state, searching depth more moves before
+    estimating it with rough_outcome().
+    """
+    if state.is_terminal():
+        return terminal_score(game, state)
+    if depth <= 0:
+        return state.rough_outcome()
+    if depth == 1:
+        # the children are all estimated, so evaluate them in one batch
+        with tracing.span('child_rough_outcomes'):
+            outcomes = state.child_rough_outcomes()
+        return max([(-1) * x for x in outcomes.values()])
+    return best_child_score(game, state, limited_move_score, depth - 1)
+
+
+def terminal_score(game: Game, state: GameState) -> int:
+    """
+    Return the score of state, a state where game is over, for the player
+    whose turn it is: 1 for a win, -1 for a loss and 0 for a tie.
+    """
+    game.current_state = state
+    player = state.get_current_player_name()
+    if game.is_winner(player):
+        return 1
+    elif game.is_winner('p2' if player == 'p1' else 'p1'):
+        return -1
+    return 0
+
+
+def search_state(state: GameState) -> GameState:
+    """
+    Return the state a search from state should explore: a copy of state if
+    it supports in-place moves, so the search can modify it, or else state.
+    """
+    return state.copy() if state.IN_PLACE else state
+
+
+def child_scores(game: Game, state: GameState, score: Callable[..., float],
+                 *args: Any) -> List[float]:
+    """
+    Return the score, for the current player of state, of making each
+    possible move from state, where score(game, child, *args) is the score
+    of child for its own current player.
+
+    If state supports in-place moves, each move is applied to state and taken
+    back once scored, instead of building a new state.
+    """
+    if tracing.ACTIVE:
+        return traced_child_scores(game, state, score, *args)
+    return [move_score(game, state, move, score, *args)
+            for move in state.legal_moves()]
+
+
+def best_child_score(game: Game, state: GameState,
+                     score: Callable[..., float], *args: Any) -> float:
+    """
+    Return max(child_scores(game, state, score, *args)), but without scoring
+    (or generating, see iter_moves) the moves after one that wins.
+
+    >>> from subtract_square_state import SubtractSquareState
+    >>> from subtract_square_game import SubtractSquareGame
+    >>> game = SubtractSquareGame.__new__(SubtractSquareGame)
+    >>> best_child_score(game, SubtractSquareState(True, 10 ** 6),
+    ...                  lambda game, child: -1)
+    1
+
+    A traced search stops at the same move, with a span for each move
+    scored:
+
+    >>> tracing.start_tracing()
+    >>> best_child_score(game, SubtractSquareState(True, 10 ** 6),
+    ...                  lambda game, child: -1)
+    1
+    >>> [e['name'] for e in tracing.stop_tracing()]
+    ['move']
+    """
+    best = -1
+    for move in state.iter_moves():
+        if tracing.ACTIVE:
+            with tracing.span('move', move=str(move)):
+                best = max(best, move_score(game, state, move, score, *args))
+        else:
+            best = max(best, move_score(game, state, move, score, *args))
+        if best == 1:
+            break
+    return best
+
+
+def move_score(game: Game, state: GameState, move: Any,
+               score: Callable[..., float], *args: Any) -> float:
+    """
+    Return the score, for the current player of state, of making move from
+    state, where score(game, child, *args) is the score of child for its own
+    current player. If state supports in-place moves, move is applied to
+    state and taken back, instead of building a new state.
+    """
+    if state.IN_PLACE:
+        undo = state.apply_move(move)
+        result = (-1) * score(game, state, *args)
+        state.undo_move(undo)
+        return result
+    return (-1) * score(game, state.make_move(move), *args)
+
+
+def traced_child_scores(game: Game, state: GameState,
+                        score: Callable[..., float],
+                        *args: Any) -> List[float]:
+    """
+    Return child_scores(game, state, score, *args), tracing the search of
+    each move as a span.
+    """
+    scores = []
+    for move in state.legal_moves():
+        with tracing.span('move', move=str(move)):
+            scores.append(move_score(game, state, move, score, *args))
+    return scores
+
+
+class CountingMemo:
+    """
+    A memo that counts the lookups and stores made in the memo it wraps, to
+    be shown in a trace.
+
+    memo - the memo wrapped
+    counts - the number of hits, misses and stores so far
+    """
+    memo: Any
+    counts: Dict[str, int]
+
+    def __init__(self, memo: Any) -> None:
+        """
+        Initialize a CountingMemo wrapping memo.
+
+        >>> memo = CountingMemo({1: -1})
+        >>> memo.get(1), memo.get(2)
+        (-1, None)
+        >>> memo[2] = 1
+        >>> memo.counts
+        {'hits': 1, 'misses': 1, 'stores': 1}
+        """
+        self.memo = memo
+        self.counts = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Return the value of key in the memo, or default.
+        """
+        value = self.memo.get(key)
+        if value is None:
+            self.counts['misses'] += 1
+            return default
+        self.counts['hits'] += 1
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        """
+        Store value for key in the memo.
+        """
+        self.counts['stores'] += 1
+        self.memo[key] = value
+
+
 def return_max_move(moves: List[object], scores: List[int]) -> object:
     """ Return a move from moves where its corresponding score in scores
     is equal to max(scores).
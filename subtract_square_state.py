@@ -3,7 +3,7 @@ An implementation of a state for SubtractSquare.
 
 NOTE: You do not have to run python-ta on this file.
 """
-from typing import Any
+from typing import Any, Iterator, Tuple
 from game_state import GameState
 
 
@@ -11,6 +11,7 @@ class SubtractSquareState(GameState):
     """
     The state of a game at a certain point in time.
     """
+    IN_PLACE = True
 
     def __init__(self, is_p1_turn: bool, current_total: int) -> None:
         """
@@ -31,12 +32,34 @@ class SubtractSquareState(GameState):
         Return all possible moves that can be applied to this state.
         """
         moves = []
-        for i in range(1, self.current_total + 1):
-            if i ** 2 <= self.current_total:
-                moves.append(i ** 2)
+        i = 1
+        while i ** 2 <= self.current_total:
+            moves.append(i ** 2)
+            i += 1
 
         return moves
 
+    def is_terminal(self) -> bool:
+        """
+        Return whether the game is over at this state, in constant time:
+        nothing is left to subtract.
+        """
+        return self.current_total == 0
+
+    def iter_moves(self) -> Iterator[int]:
+        """
+        Return an iterator over the moves of get_possible_moves(), generated
+        one at a time.
+
+        >>> next(SubtractSquareState(True, 10 ** 12).iter_moves())
+        1
+        """
+        total = self.current_total
+        i = 1
+        while i ** 2 <= total:
+            yield i ** 2
+            i += 1
+
     def make_move(self, move: Any) -> "SubtractSquareState":
         """
         Return the GameState that results from applying move to this GameState.
@@ -48,6 +71,110 @@ class SubtractSquareState(GameState):
                                         self.current_total - move)
         return new_state
 
+    def copy(self) -> "SubtractSquareState":
+        """
+        Return a copy of self that apply_move and undo_move can modify
+        without affecting self.
+        """
+        new_state = SubtractSquareState(self.p1_turn, self.current_total)
+        new_state._moves = self._moves
+        new_state._move_set = self._move_set
+        return new_state
+
+    def apply_move(self, move: Any) -> int:
+        """
+        Apply move to self in place, and return the amount subtracted as the
+        undo record.
+
+        >>> x = SubtractSquareState(True, 10)
+        >>> undo = x.apply_move(9)
+        >>> x.current_total, x.p1_turn
+        (1, False)
+        >>> x.undo_move(undo)
+        >>> x == SubtractSquareState(True, 10)
+        True
+        """
+        if type(move) == str:
+            move = int(move)
+        self.current_total -= move
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+        return move
+
+    def undo_move(self, undo: int) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+        """
+        self.current_total += undo
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+
+    def game_args(self) -> Tuple[bool, int]:
+        """
+        Return the arguments that make a SubtractSquareState.
+        """
+        return True, 0
+
+    def move_index(self, move: Any) -> int:
+        """
+        Return the index of move: i - 1 for the move i ** 2.
+
+        >>> SubtractSquareState(True, 20).move_index(16)
+        3
+        """
+        if type(move) == str:
+            move = int(move)
+        return round(move ** 0.5) - 1
+
+    def index_move(self, index: int) -> int:
+        """
+        Return the move whose move_index is index.
+
+        >>> SubtractSquareState(True, 20).index_move(3)
+        16
+        """
+        return (index + 1) ** 2
+
+    def state_key(self) -> int:
+        """
+        Return the total times 2, plus 1 if it is p2's turn.
+
+        >>> SubtractSquareState(False, 20).state_key()
+        41
+        """
+        return self.current_total * 2 + (not self.p1_turn)
+
+    def from_key(self, key: int) -> "SubtractSquareState":
+        """
+        Return the state whose state_key is key.
+
+        >>> SubtractSquareState(True, 0).from_key(41)
+        P1's Turn: False - Total: 20
+        """
+        return SubtractSquareState(not key & 1, key >> 1)
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other are the same position.
+
+        >>> SubtractSquareState(True, 5).make_move(1) == \\
+        ...     SubtractSquareState(False, 8).make_move(4)
+        False
+        >>> SubtractSquareState(True, 5).make_move(1) == \\
+        ...     SubtractSquareState(True, 13).make_move(9)
+        True
+        """
+        return (type(self) is type(other) and
+                self.p1_turn == other.p1_turn and
+                self.current_total == other.current_total)
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of self consistent with __eq__.
+        """
+        return hash((self.p1_turn, self.current_total))
+
     def __repr__(self) -> str:
         """
         Return a representation of this state (which can be used for
@@ -0,0 +1,444 @@
+"""
+Subtraction games: players take turns subtracting an amount from a shared
+total, choosing from a fixed set of amounts, and the last player able to move
+wins. Subtract Square is the subtraction game whose amounts are the squares.
+
+The outcome of every total is solved incrementally, and for a finite set of
+amounts the sequence of outcomes is eventually periodic, so any total is then
+answered in constant time from one period of the sequence.
+"""
+from typing import (Any, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
+from game import Game
+from game_state import GameState
+
+
+class SubtractionSet:
+    """
+    The amounts that can be subtracted in a subtraction game, given either as
+    a finite collection of positive integers or as a rule (a predicate on
+    positive integers, such as is_pos_square), together with the outcomes
+    solved so far.
+
+    The outcome of total n only depends on the outcomes of the previous
+    largest-amount totals, so for a finite set these windows of outcomes must
+    repeat, and the outcomes repeat from there on. Once that happens only the
+    preperiod and one period are kept, however large the totals asked about.
+    Outcomes for a rule are solved up to the largest total asked about.
+
+    rule - the predicate defining the amounts, or None for a finite set
+    members - the amounts found so far, in increasing order (all of them, for
+              a finite set)
+    outcomes - whether the player to move wins, for each total solved so far
+    preperiod - for a finite set, the first total from which the outcomes
+                are periodic, once found
+    period - for a finite set, the period of the outcomes once found, else 0
+    """
+    rule: Optional[Callable[[int], bool]]
+    members: List[int]
+    outcomes: bytearray
+    preperiod: int
+    period: int
+
+    def __init__(self, amounts: Optional[Iterable[int]] = None,
+                 rule: Optional[Callable[[int], bool]] = None) -> None:
+        """
+        Initialize the subtraction set with the finite collection amounts, or
+        else with the amounts satisfying rule.
+
+        Precondition: exactly one of amounts and rule is given, and every
+        amount is a positive integer.
+
+        >>> SubtractionSet([3, 1, 3]).members
+        [1, 3]
+        """
+        self.rule = rule
+        self.members = sorted(set(amounts)) if rule is None else []
+        self.outcomes = bytearray()
+        self.preperiod = 0
+        self.period = 0
+        # for a finite set: the total at the end of each window of outcomes
+        self._windows = {}  # type: Dict[bytes, int]
+        # for a rule: the largest integer tested so far
+        self._tested = 0
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the subtraction set.
+
+        >>> str(SubtractionSet([1, 2, 3]))
+        '{1, 2, 3}'
+        """
+        if self.rule is not None:
+            return 'the amounts satisfying {}'.format(self.rule.__name__)
+        return '{' + ', '.join(str(x) for x in self.members) + '}'
+
+    def _find_members(self, total: int) -> None:
+        """
+        Test the rule on every integer up to total, if it is not done yet.
+        """
+        if self.rule is not None:
+            for n in range(self._tested + 1, total + 1):
+                if self.rule(n):
+                    self.members.append(n)
+            self._tested = max(self._tested, total)
+
+    def _solve(self, total: int) -> None:
+        """
+        Solve the outcomes up to total, or until they are known to repeat.
+        """
+        outcomes = self.outcomes
+        members = self.members
+        largest = members[-1] if members and self.rule is None else 0
+        self._find_members(total)
+        while len(outcomes) <= total and not self.period:
+            n = len(outcomes)
+            win = 0
+            for amount in members:
+                if amount > n:
+                    break
+                if not outcomes[n - amount]:
+                    win = 1
+                    break
+            outcomes.append(win)
+            if self.rule is None and n + 1 >= largest:
+                window = bytes(outcomes[n + 1 - largest:])
+                if window in self._windows:
+                    self._found_period(self._windows[window] + 1, n + 1)
+                else:
+                    self._windows[window] = n
+
+    def _found_period(self, start: int, repeat: int) -> None:
+        """
+        Record that the outcomes from total repeat on are the same as the
+        ones from total start on, and drop the outcomes past one period.
+        """
+        outcomes = self.outcomes
+        period = repeat - start
+        while (start > 0 and
+               outcomes[start - 1] == outcomes[start - 1 + period]):
+            start -= 1
+        del outcomes[start + period:]
+        self.preperiod = start
+        self.period = period
+        self._windows = {}
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other allow the same amounts.
+
+        >>> SubtractionSet([1, 4]) == SubtractionSet([4, 1])
+        True
+        """
+        return (type(self) is type(other) and self.rule == other.rule and
+                (self.rule is not None or self.members == other.members))
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of the amounts allowed.
+        """
+        if self.rule is not None:
+            return hash(self.rule)
+        return hash(tuple(self.members))
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """
+        Pickle the subtraction set as its amounts or rule only: the outcomes
+        are solved again as they are needed.
+
+        >>> import pickle
+        >>> s = SubtractionSet([1, 4])
+        >>> s.is_win(10 ** 6)
+        False
+        >>> t = pickle.loads(pickle.dumps(s))
+        >>> t.members, len(t.outcomes), t.is_win(10 ** 6)
+        ([1, 4], 0, False)
+        """
+        if self.rule is not None:
+            return SubtractionSet, (None, self.rule)
+        return SubtractionSet, (self.members,)
+
+    def is_win(self, total: int) -> bool:
+        """
+        Return whether the player to move with total left can guarantee a
+        win.
+
+        >>> s = SubtractionSet([1, 2, 3])
+        >>> [s.is_win(n) for n in range(6)]
+        [False, True, True, True, False, True]
+        >>> s.is_win(10 ** 100)
+        False
+        """
+        if not self.period:
+            self._solve(total)
+        if self.period and total >= self.preperiod:
+            total = self.preperiod + (total - self.preperiod) % self.period
+        return bool(self.outcomes[total])
+
+    def moves(self, total: int) -> List[int]:
+        """
+        Return the amounts that can be subtracted from total.
+
+        >>> SubtractionSet([2, 5]).moves(4)
+        [2]
+        """
+        self._find_members(total)
+        result = []
+        for amount in self.members:
+            if amount > total:
+                break
+            result.append(amount)
+        return result
+
+    def winning_moves(self, total: int) -> List[int]:
+        """
+        Return the amounts that can be subtracted from total to leave the
+        opponent in a losing position.
+
+        >>> SubtractionSet([1, 2, 3]).winning_moves(10 ** 9 + 2)
+        [2]
+        """
+        return [amount for amount in self.moves(total)
+                if not self.is_win(total - amount)]
+
+
+class SubtractionState(GameState):
+    """
+    The state of a subtraction game at a certain point in time.
+
+    amounts - the amounts that can be subtracted
+    current_total - the total left
+    """
+    IN_PLACE = True
+    amounts: SubtractionSet
+    current_total: int
+
+    def __init__(self, is_p1_turn: bool, amounts: SubtractionSet,
+                 current_total: int) -> None:
+        """
+        Initialize this game state and set the current player based on
+        is_p1_turn.
+
+        >>> x = SubtractionState(True, SubtractionSet([1, 4]), 6)
+        >>> x.get_possible_moves()
+        [1, 4]
+        """
+        super().__init__(is_p1_turn)
+        self.amounts = amounts
+        self.current_total = current_total
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the current state of the game.
+        """
+        return "Current total: {}".format(self.current_total)
+
+    def get_possible_moves(self) -> list:
+        """
+        Return all possible moves that can be applied to this state.
+        """
+        return self.amounts.moves(self.current_total)
+
+    def iter_moves(self) -> Iterator[int]:
+        """
+        Return an iterator over the moves of get_possible_moves(), with the
+        ones that leave the opponent in a losing position first.
+
+        >>> x = SubtractionState(True, SubtractionSet([1, 2, 3]), 6)
+        >>> list(x.iter_moves())
+        [2, 1, 3]
+        """
+        total = self.current_total
+        wins = self.amounts.winning_moves(total)
+        yield from wins
+        for amount in self.amounts.moves(total):
+            if amount not in wins:
+                yield amount
+
+    def make_move(self, move: Any) -> 'SubtractionState':
+        """
+        Return the GameState that results from applying move to this GameState.
+        """
+        if type(move) == str:
+            move = int(move)
+        return SubtractionState(not self.p1_turn, self.amounts,
+                                self.current_total - move)
+
+    def copy(self) -> 'SubtractionState':
+        """
+        Return a copy of self that apply_move and undo_move can modify
+        without affecting self.
+        """
+        new_state = SubtractionState(self.p1_turn, self.amounts,
+                                     self.current_total)
+        new_state._moves = self._moves
+        new_state._move_set = self._move_set
+        return new_state
+
+    def apply_move(self, move: Any) -> int:
+        """
+        Apply move to self in place, and return the amount subtracted as the
+        undo record.
+        """
+        if type(move) == str:
+            move = int(move)
+        self.current_total -= move
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+        return move
+
+    def undo_move(self, undo: int) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+        """
+        self.current_total += undo
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+
+    def game_args(self) -> Tuple[bool, SubtractionSet, int]:
+        """
+        Return the arguments that make a state with the same amounts as self.
+        """
+        return True, self.amounts, 0
+
+    def move_index(self, move: Any) -> int:
+        """
+        Return the index of move among the amounts, in increasing order.
+
+        >>> SubtractionState(True, SubtractionSet([1, 4]), 6).move_index(4)
+        1
+        """
+        if type(move) == str:
+            move = int(move)
+        self.amounts.moves(move)
+        return self.amounts.members.index(move)
+
+    def index_move(self, index: int) -> int:
+        """
+        Return the move whose move_index is index.
+
+        Precondition: the subtraction set has more than index amounts.
+        """
+        amounts = self.amounts
+        total = amounts.members[-1] if amounts.members else 0
+        while len(amounts.members) <= index:
+            total = 2 * total + 1
+            amounts.moves(total)
+        return amounts.members[index]
+
+    def state_key(self) -> int:
+        """
+        Return the total times 2, plus 1 if it is p2's turn.
+        """
+        return self.current_total * 2 + (not self.p1_turn)
+
+    def from_key(self, key: int) -> 'SubtractionState':
+        """
+        Return the state with the same amounts as self whose state_key is key.
+
+        >>> x = SubtractionState(False, SubtractionSet([1, 4]), 6)
+        >>> x.from_key(x.state_key()) == x
+        True
+        """
+        return SubtractionState(not key & 1, self.amounts, key >> 1)
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other are the same position.
+
+        >>> s = SubtractionSet([1, 4])
+        >>> SubtractionState(True, s, 6).make_move(4) == \\
+        ...     SubtractionState(True, s, 3).make_move(1)
+        True
+        """
+        return (type(self) is type(other) and
+                self.amounts == other.amounts and
+                self.p1_turn == other.p1_turn and
+                self.current_total == other.current_total)
+
+    def __hash__(self) -> int:
+        """
+        Return a hash of self consistent with __eq__.
+        """
+        return hash((self.p1_turn, self.current_total))
+
+    def __repr__(self) -> str:
+        """
+        Return a representation of this state (which can be used for
+        equality testing).
+        """
+        return "P1's Turn: {} - Total: {} - Amounts: {}".format(
+            self.p1_turn, self.current_total, self.amounts)
+
+    def rough_outcome(self) -> float:
+        """
+        Return the outcome the current player can guarantee from state self,
+        which the subtraction set solves exactly.
+
+        >>> x = SubtractionState(True, SubtractionSet([1, 2, 3]), 8)
+        >>> x.rough_outcome()
+        -1
+        """
+        if self.amounts.is_win(self.current_total):
+            return self.WIN
+        return self.LOSE
+
+
+class SubtractionGame(Game):
+    """
+    A subtraction game with a finite set of amounts chosen by the players.
+    """
+
+    def __init__(self, p1_starts: bool, amounts: List[int] = None,
+                 count: int = None) -> None:
+        """
+        Initialize this Game, using p1_starts to find who the first player is.
+        The amounts that can be subtracted and the number to subtract from
+        are asked for unless they are given.
+        """
+        if amounts is not None and count is not None:
+            self.current_state = SubtractionState(
+                p1_starts, SubtractionSet(amounts), count)
+            return
+        amounts = input('Enter the amounts that can be subtracted, '
+                        'separated by spaces: ').split()
+        while not amounts or not all(x.isdigit() and int(x) > 0
+                                     for x in amounts):
+            amounts = input('Input is not valid. Try again: ').split()
+        count = int(input("Enter the number to subtract from: "))
+        self.current_state = SubtractionState(
+            p1_starts, SubtractionSet(int(x) for x in amounts), count)
+
+    def get_instructions(self) -> str:
+        """
+        Return the instructions for this Game.
+        """
+        return "Players take turns subtracting one of the amounts {} from " \
+               "the starting number, without going below 0. The winner is " \
+               "the last player able to subtract.".format(
+                   self.current_state.amounts)
+
+    def is_over(self, state: SubtractionState) -> bool:
+        """
+        Return whether or not this game is over at state.
+        """
+        return state.is_terminal()
+
+    def is_winner(self, player: str) -> bool:
+        """
+        Return whether player has won the game.
+
+        Precondition: player is 'p1' or 'p2'.
+        """
+        return (self.current_state.get_current_player_name() != player
+                and self.is_over(self.current_state))
+
+    def str_to_move(self, string: str) -> Any:
+        """
+        Return the move that string represents. If string is not a move,
+        return an invalid move.
+        """
+        if not string.strip().isdigit():
+            return -1
+        return int(string.strip())
@@ -1,9 +1,25 @@
 """
 Superclass Game
 """
-from typing import Any, Union
+from typing import Any, List, Tuple, Union
 from game import Game
-from game_state import GameState
+from game_state import GameState, estimate_outcome
+
+# Bit i - 1 of a mask stands for cell i (1 is the top left, 9 the bottom right)
+FULL_MASK = 0b111111111
+
+# The three rows, three columns and two diagonals
+WIN_MASKS = [0b000000111, 0b000111000, 0b111000000,
+             0b001001001, 0b010010010, 0b100100100,
+             0b100010001, 0b001010100]
+
+# Whether each 9-bit mask contains a whole row, column or diagonal
+WINNING = tuple(any(mask & x == x for x in WIN_MASKS)
+                for mask in range(FULL_MASK + 1))
+
+# Empty cells of each 9-bit mask of occupied cells, as moves
+EMPTY_CELLS = tuple(tuple(i + 1 for i in range(9) if not mask >> i & 1)
+                    for mask in range(FULL_MASK + 1))
 
 
 class TicTacToe(Game):
@@ -31,13 +47,7 @@ class TicTacToe(Game):
         """
         Return whether or not this game is over at state.
         """
-        return (all([x != ' ' for x in state.board]) or
-                ['X', 'X', 'X'] in state.rows or
-                ['O', 'O', 'O'] in state.rows or
-                ['X', 'X', 'X'] in state.columns or
-                ['O', 'O', 'O'] in state.columns or
-                ['X', 'X', 'X'] in state.diag or
-                ['O', 'O', 'O'] in state.diag)
+        return state.is_terminal()
 
     def is_winner(self, player: str) -> bool:
         """
@@ -45,17 +55,9 @@ class TicTacToe(Game):
 
         Precondition: player is 'p1' or 'p2'.
         """
-        if not self.is_over(self.current_state):
-            return False
-        if (['O', 'O', 'O'] in self.current_state.rows or
-            ['O', 'O', 'O'] in self.current_state.columns or
-            ['O', 'O', 'O'] in self.current_state.diag) and player == 'p1':
-            return True
-        if (['X', 'X', 'X'] in self.current_state.rows or
-            ['X', 'X', 'X'] in self.current_state.columns or
-            ['X', 'X', 'X'] in self.current_state.diag) and player == 'p2':
-            return True
-        return False
+        if player == 'p1':
+            return WINNING[self.current_state.o_mask]
+        return WINNING[self.current_state.x_mask]
 
     def str_to_move(self, string: str) -> Any:
         """
@@ -84,11 +86,17 @@ class TicTacToeCS(GameState):
     LOSE - score if player is in a losing position
     DRAW - score if player is in a tied position
     p1_turn - whether it is p1's turn or not
+    o_mask - cells marked O by p1, bit i - 1 standing for cell i
+    x_mask - cells marked X by p2, bit i - 1 standing for cell i
     """
     WIN: int = 1
     LOSE: int = -1
     DRAW: int = 0
+    IN_PLACE: bool = True
+    __slots__ = ('p1_turn', 'o_mask', 'x_mask')
     p1_turn: bool
+    o_mask: int
+    x_mask: int
 
     BOARD = """ {0[0]} | {0[1]} | {0[2]}
 --- --- ---
@@ -104,12 +112,19 @@ class TicTacToeCS(GameState):
 
         """
         super().__init__(is_p1_turn)
-        self.board = [' ' for _ in range(9)]
-        self.rows = [[self.board[i+j-1] for i in range(3)] for j in [1, 4, 7]]
-        self.columns = [[self.board[j + 3 * i] for i in range(3)]
-                        for j in range(3)]
-        self.diag = [[self.board[0], self.board[4], self.board[8]],
-                     [self.board[2], self.board[4], self.board[6]]]
+        self.o_mask = 0
+        self.x_mask = 0
+
+    @property
+    def board(self) -> List[str]:
+        """
+        Return the mark in each cell ('O', 'X' or ' '), from the top left.
+
+        >>> TicTacToeCS(True).make_move(2).make_move(9).board[:3]
+        [' ', 'O', ' ']
+        """
+        return ['O' if self.o_mask >> i & 1 else
+                'X' if self.x_mask >> i & 1 else ' ' for i in range(9)]
 
     def __str__(self) -> str:
         """
@@ -120,44 +135,141 @@ class TicTacToeCS(GameState):
             lst.append(xd(item))
         return self.BOARD.format(lst)
 
+    def is_terminal(self) -> bool:
+        """
+        Return whether the game is over at this state, in constant time from
+        the masks: the board is full or a player has three in a row.
+        """
+        return bool(self.o_mask | self.x_mask == FULL_MASK or
+                    WINNING[self.o_mask] or WINNING[self.x_mask])
+
     def get_possible_moves(self) -> list:
         """
         Return all possible moves that can be applied to this state.
+
+        >>> TicTacToeCS(True).make_move(1).make_move(5).get_possible_moves()
+        [2, 3, 4, 6, 7, 8, 9]
         """
-        if (['X', 'X', 'X'] in self.rows or
-            ['O', 'O', 'O'] in self.rows or
-            ['X', 'X', 'X'] in self.columns or
-            ['O', 'O', 'O'] in self.columns or
-            ['X', 'X', 'X'] in self.diag or
-            ['O', 'O', 'O'] in self.diag):
+        if WINNING[self.o_mask] or WINNING[self.x_mask]:
             return []
-        return [i+1 for i in range(9) if self.board[i] == ' ']
+        return list(EMPTY_CELLS[self.o_mask | self.x_mask])
 
     def make_move(self, move: int) -> 'TicTacToeCS':
         """
         Return the GameState that results from applying move to this GameState.
         """
-        symbol = 'X'
+        new_state = self.copy()
+        new_state.apply_move(move)
+        return new_state
+
+    def copy(self) -> 'TicTacToeCS':
+        """
+        Return a copy of self that apply_move and undo_move can modify
+        without affecting self.
+        """
+        new_state = TicTacToeCS.__new__(TicTacToeCS)
+        new_state.p1_turn = self.p1_turn
+        new_state.o_mask = self.o_mask
+        new_state.x_mask = self.x_mask
+        new_state._moves = self._moves
+        new_state._move_set = self._move_set
+        return new_state
+
+    def apply_move(self, move: int) -> int:
+        """
+        Apply move to self in place, and return the move as the undo record.
+
+        >>> x = TicTacToeCS(True)
+        >>> undo = x.apply_move(5)
+        >>> x.board[4], x.p1_turn
+        ('O', False)
+        >>> x.undo_move(undo)
+        >>> x == TicTacToeCS(True)
+        True
+        """
+        if self.p1_turn:
+            self.o_mask |= 1 << (move - 1)
+        else:
+            self.x_mask |= 1 << (move - 1)
+        self.p1_turn = not self.p1_turn
+        self.forget_moves()
+        return move
+
+    def undo_move(self, undo: int) -> None:
+        """
+        Take back the last move applied with apply_move, given the undo record
+        it returned.
+        """
+        self.p1_turn = not self.p1_turn
         if self.p1_turn:
-            symbol = 'O'
-        new_state = TicTacToeCS(not self.p1_turn)
-        new_state.board = self.board[:]
-        new_state.board[move - 1] = symbol
-        new_state.rows = [[new_state.board[i+j-1] for i in range(3)]
-                          for j in [1, 4, 7]]
-        new_state.columns = [[new_state.board[j + 3 * i] for i in range(3)]
-                             for j in range(3)]
-        new_state.diag = [[new_state.board[0], new_state.board[4],
-                           new_state.board[8]],
-                          [new_state.board[2], new_state.board[4],
-                           new_state.board[6]]]
+            self.o_mask &= ~(1 << (undo - 1))
+        else:
+            self.x_mask &= ~(1 << (undo - 1))
+        self.forget_moves()
+
+    def game_args(self) -> Tuple[bool]:
+        """
+        Return the arguments that make a TicTacToeCS.
+        """
+        return (True,)
+
+    def move_index(self, move: int) -> int:
+        """
+        Return the index of move: move - 1.
+        """
+        return move - 1
+
+    def index_move(self, index: int) -> int:
+        """
+        Return the move whose move_index is index.
+        """
+        return index + 1
+
+    def state_key(self) -> int:
+        """
+        Return the cells of p1, then the cells of p2, then whether it is p2's
+        turn, as the bits of an integer.
+
+        >>> TicTacToeCS(False).make_move(1).state_key()
+        512
+        """
+        return self.o_mask | self.x_mask << 9 | (not self.p1_turn) << 18
+
+    def from_key(self, key: int) -> 'TicTacToeCS':
+        """
+        Return the state whose state_key is key.
+
+        >>> x = TicTacToeCS(True).make_move(5).make_move(1)
+        >>> x.from_key(x.state_key()) == x
+        True
+        """
+        new_state = TicTacToeCS(not key >> 18 & 1)
+        new_state.o_mask = key & FULL_MASK
+        new_state.x_mask = key >> 9 & FULL_MASK
         return new_state
 
-    def is_valid_move(self, move: Any) -> bool:
+    def __eq__(self, other: Any) -> bool:
+        """
+        Return whether self and other are the same position.
+
+        >>> x = TicTacToeCS(True)
+        >>> x.make_move(1).make_move(2).make_move(3) == \\
+        ...     x.make_move(3).make_move(2).make_move(1)
+        True
+        >>> x.make_move(1).make_move(2) == x.make_move(2).make_move(1)
+        False
+        """
+        return (type(self) is type(other) and
+                self.p1_turn == other.p1_turn and
+                self.o_mask == other.o_mask and
+                self.x_mask == other.x_mask)
+
+    def __hash__(self) -> int:
         """
-        Return whether move is a valid move for this GameState.
+        Return a hash of self: both masks and the current player packed into
+        one integer, which is distinct for every position.
         """
-        return move in self.get_possible_moves()
+        return self.o_mask | self.x_mask << 9 | (not self.p1_turn) << 18
 
     def __repr__(self) -> Any:
         """
@@ -170,5 +282,67 @@ class TicTacToeCS(GameState):
         """
         Return an estimate in interval [LOSE, WIN] of best outcome the current
         player can guarantee from state self.
+
+        The estimate of every board is computed once, when the module is
+        imported (see _OUTCOMES), so this is a single lookup.
+
+        >>> TicTacToeCS(True).make_move(1).make_move(4).rough_outcome()
+        0.075
+        >>> TicTacToeCS(True).make_move(1).make_move(4).make_move(2)\\
+        ...     .rough_outcome()
+        -0.54375
         """
-        raise NotImplementedError
+        if self.p1_turn:
+            mine, theirs = self.o_mask, self.x_mask
+        else:
+            mine, theirs = self.x_mask, self.o_mask
+        return _OUTCOMES[mine | theirs << 9]
+
+
+def pattern_outcome(mine: int, theirs: int) -> float:
+    """
+    Return an estimate in interval [LOSE, WIN] of the best outcome the player
+    to move can guarantee, where mine and theirs are the masks of the cells
+    marked by that player and by the opponent.
+
+    The estimate is exact when the game is over (the player to move has lost
+    or tied), WIN when a line can be completed right away, and LOSE when the
+    opponent threatens to complete two lines that cannot both be blocked.
+    Otherwise it compares the lines still open to each player, weighted by
+    the marks already in them, and is worse when a line must be blocked.
+
+    >>> pattern_outcome(0b000000011, 0b000011000)
+    1
+    >>> pattern_outcome(0b000000001, 0b000011010)
+    -1
+    >>> pattern_outcome(0, 0)
+    0.0
+    """
+    if WINNING[theirs]:
+        return TicTacToeCS.LOSE
+    if mine | theirs == FULL_MASK:
+        return TicTacToeCS.DRAW
+    threats = 0
+    balance = 0
+    for line in WIN_MASKS:
+        count_mine = bin(line & mine).count('1')
+        count_theirs = bin(line & theirs).count('1')
+        if count_mine == 2 and not count_theirs:
+            return TicTacToeCS.WIN
+        if count_theirs == 2 and not count_mine:
+            threats |= line & ~theirs
+        # a line still open to one player counts for the marks in it
+        if not count_theirs:
+            balance += 1 + count_mine
+        if not count_mine:
+            balance -= 1 + count_theirs
+    if bin(threats).count('1') > 1:
+        return TicTacToeCS.LOSE
+    return estimate_outcome(balance / (3 * len(WIN_MASKS)), bool(threats))
+
+
+# pattern_outcome of each of the 3 ** 9 ways to mark the board, keyed by the
+# current player's mask | the opponent's mask << 9
+_OUTCOMES = {mine | theirs << 9: pattern_outcome(mine, theirs)
+            for mine in range(FULL_MASK + 1)
+            for theirs in range(FULL_MASK + 1) if not mine & theirs}
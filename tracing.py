@@ -0,0 +1,198 @@
+"""
+Opt-in tracing of searches, written in the Chrome trace-event format, which
+Perfetto (ui.perfetto.dev) and chrome://tracing can open.
+
+Tracing is off unless start_tracing() is called (or GAME_TRACE is set when
+game_interface.py is run), and span() costs almost nothing while it is off.
+A trace is kept small by only recording spans up to a nesting depth, and by
+sampling: a span that is not sampled is dropped along with every span inside
+it.
+
+    >>> start_tracing()
+    >>> with span('search', moves=3):
+    ...     with span('move', move='A'):
+    ...         pass
+    >>> [(e['name'], e['ph']) for e in stop_tracing()]
+    [('move', 'X'), ('search', 'X')]
+"""
+from typing import Any, Callable, Dict, List, Optional
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# Whether tracing is on, for callers to check before doing any work just to
+# trace (such as building the arguments of a span)
+ACTIVE = False
+
+# The current Tracer, when ACTIVE
+_tracer = None
+
+
+class Tracer:
+    """
+    The events recorded since tracing started.
+
+    events - the trace events, in the order their spans ended
+    sample_rate - the chance that a span is recorded
+    max_depth - the deepest nesting of spans recorded (1 is outermost)
+    max_events - the most events recorded, after which spans are dropped
+    depth - the nesting depth of the spans open now
+    dropped - depth at which an unrecorded span is open, or 0 if none is
+    """
+    events: List[Dict[str, Any]]
+    sample_rate: float
+    max_depth: int
+    max_events: int
+    depth: int
+    dropped: int
+
+    def __init__(self, sample_rate: float, max_depth: int,
+                 max_events: int) -> None:
+        """
+        Initialize a Tracer that records sample_rate of its spans, nested at
+        most max_depth deep, up to max_events events.
+        """
+        self.events = []
+        self.sample_rate = sample_rate
+        self.max_depth = max_depth
+        self.max_events = max_events
+        self.depth = 0
+        self.dropped = 0
+        self._random = random.Random(0)
+        self._pid = os.getpid()
+
+
+class _Span:
+    """
+    A span of time being recorded, as a context manager.
+    """
+    __slots__ = ('name', 'category', 'args', 'start', 'recorded')
+
+    def __init__(self, name: str, category: str,
+                 args: Dict[str, Any]) -> None:
+        """
+        Initialize a span called name in category, with args.
+        """
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+        self.recorded = False
+
+    def __enter__(self) -> '_Span':
+        """
+        Start the span, if the tracer records it.
+        """
+        tracer = _tracer
+        tracer.depth += 1
+        if (not tracer.dropped and tracer.depth <= tracer.max_depth and
+                len(tracer.events) < tracer.max_events and
+                (tracer.sample_rate >= 1 or
+                 tracer._random.random() < tracer.sample_rate)):
+            self.recorded = True
+            self.start = time.perf_counter_ns()
+        elif not tracer.dropped:
+            tracer.dropped = tracer.depth
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        """
+        End the span, adding its event to the trace if it is recorded.
+        """
+        tracer = _tracer
+        if tracer is None:
+            return
+        if self.recorded:
+            end = time.perf_counter_ns()
+            tracer.events.append({
+                'name': self.name, 'cat': self.category, 'ph': 'X',
+                'ts': self.start / 1000, 'dur': (end - self.start) / 1000,
+                'pid': tracer._pid, 'tid': threading.get_ident(),
+                'args': self.args})
+        elif tracer.dropped == tracer.depth:
+            tracer.dropped = 0
+        tracer.depth -= 1
+
+
+class _NoSpan:
+    """
+    A span that records nothing, used while tracing is off.
+    """
+
+    def __enter__(self) -> '_NoSpan':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, category: str = 'search', **args: Any) -> Any:
+    """
+    Return a context manager recording the time spent in its block as a span
+    called name in category, with args (shown in the trace viewer), if
+    tracing is on.
+    """
+    if not ACTIVE:
+        return _NO_SPAN
+    return _Span(name, category, args)
+
+
+def traced(category: str = 'strategy') -> Callable:
+    """
+    Return a decorator recording each call of a function as a span, named
+    after the function, in category.
+
+    >>> @traced()
+    ... def f(x):
+    ...     return x + 1
+    >>> start_tracing()
+    >>> f(1)
+    2
+    >>> [e['name'] for e in stop_tracing()]
+    ['f']
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not ACTIVE:
+                return function(*args, **kwargs)
+            with _Span(function.__name__, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_tracing(sample_rate: float = 1.0, max_depth: int = 4,
+                  max_events: int = 100000) -> None:
+    """
+    Start recording spans, sample_rate of them (the others are dropped with
+    the spans inside them), nested at most max_depth deep, up to max_events
+    events.
+    """
+    global ACTIVE, _tracer
+    _tracer = Tracer(sample_rate, max_depth, max_events)
+    ACTIVE = True
+
+
+def stop_tracing(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Stop recording spans and return the events recorded, also writing them
+    to the file path as a Chrome trace if path is given.
+    """
+    global ACTIVE, _tracer
+    tracer = _tracer
+    ACTIVE = False
+    _tracer = None
+    if tracer is None:
+        return []
+    if path is not None:
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': tracer.events,
+                       'displayTimeUnit': 'ms'}, trace_file)
+    return tracer.events
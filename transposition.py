@@ -0,0 +1,211 @@
+"""
+A transposition table in shared memory, so that search workers in different
+processes share the positions they have scored.
+"""
+from typing import Any, Optional, Tuple
+from multiprocessing import resource_tracker, shared_memory
+import struct
+
+# Flags of a stored value: the exact score, or a bound on it
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Depth stored for values that are not estimates (the whole game was searched)
+FULL_DEPTH = (1 << 32) - 1
+
+# Slots probed for each key, which are next to each other in memory
+BUCKET_SIZE = 4
+
+# 64-bit words in each slot: check, value and meta (see
+# SharedTranspositionTable)
+SLOT_WORDS = 3
+
+_MASK = (1 << 64) - 1
+_FLOAT = struct.Struct('<d')
+_WORD = struct.Struct('<Q')
+
+
+def fingerprint(key: int) -> int:
+    """
+    Return a 64-bit fingerprint of key, a state_key(), which is the same in
+    every process.
+
+    >>> fingerprint(12345) == fingerprint(12345)
+    True
+    >>> fingerprint(3 ** 100) != fingerprint(3 ** 100 + 1)
+    True
+    """
+    # splitmix64's finalizer spreads out the bits of hash(key), which for an
+    # int is the int itself mod 2 ** 61 - 1
+    x = hash(key) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+class SharedTranspositionTable:
+    """
+    A fixed-size, open-addressed table of scored positions, in a block of
+    shared memory that any number of processes can probe and store into.
+
+    Each slot is three 64-bit words: the check, the value (a float) and the
+    meta, which holds depth << 3 | flag << 1 | 1. The check is the XOR of the
+    key's fingerprint with the other two words, so an entry that was torn by
+    two processes writing the same slot at once fails the check and reads as
+    a miss. No locks are needed. A key may be in any slot of its bucket; a
+    store replaces the same key, an empty slot, or else the shallowest entry.
+
+    Used as the memo of in_place_states_score, it maps keys to exact scores
+    of fully searched positions.
+
+    name - the name of the shared memory block, used to attach to it
+    slots - the number of slots (a multiple of BUCKET_SIZE)
+    """
+    name: str
+    slots: int
+
+    def __init__(self, slots: int, name: str = None) -> None:
+        """
+        Create a table with at least slots slots, or attach to the existing
+        table named name, which has slots slots.
+
+        >>> table = SharedTranspositionTable(100)
+        >>> table.slots
+        128
+        >>> table.close()
+        >>> table.unlink()
+        """
+        if name is None:
+            size = BUCKET_SIZE
+            while size < slots:
+                size *= 2
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=size * SLOT_WORDS * 8)
+            self._owner = True
+        else:
+            size = slots
+            try:
+                self._memory = shared_memory.SharedMemory(name, track=False)
+            except TypeError:  # Python < 3.13 tracks every attached block
+                self._memory = shared_memory.SharedMemory(name)
+                resource_tracker.unregister(self._memory._name,
+                                            'shared_memory')
+            self._owner = False
+        self.name = self._memory.name
+        self.slots = size
+        # a new block of shared memory is filled with zeros: all slots empty
+        self._words = self._memory.buf.cast('Q')
+
+    def __reduce__(self) -> Tuple[Any, Tuple[int, str]]:
+        """
+        Pickle the table as a reference to its shared memory, so that a
+        process it is sent to attaches to the same table.
+        """
+        return SharedTranspositionTable, (self.slots, self.name)
+
+    def __enter__(self) -> 'SharedTranspositionTable':
+        """
+        Return self, to be closed (and unlinked by its creator) on exit.
+        """
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """
+        Close the table, and unlink it if this process created it.
+        """
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def close(self) -> None:
+        """
+        Stop using the table in this process.
+        """
+        self._words.release()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """
+        Free the shared memory, once every process has closed it.
+        """
+        self._memory.unlink()
+
+    def clear(self) -> None:
+        """
+        Empty every slot, for every process using the table.
+
+        >>> with SharedTranspositionTable(64) as table:
+        ...     table[7] = 1
+        ...     table.clear()
+        ...     table.get(7)
+        """
+        self._memory.buf[:] = bytes(len(self._memory.buf))
+
+    def _bucket(self, check: int) -> int:
+        """
+        Return the index of the first word of the bucket of fingerprint
+        check.
+        """
+        slot = (check * 0x9E3779B97F4A7C15 & _MASK) % self.slots
+        return (slot - slot % BUCKET_SIZE) * SLOT_WORDS
+
+    def probe(self, key: int) -> Optional[Tuple[float, int, int]]:
+        """
+        Return the value, depth and flag stored for key, or None if key is
+        not in the table.
+
+        >>> with SharedTranspositionTable(64) as table:
+        ...     table.store(7, 0.5, 3, LOWER)
+        ...     table.probe(7), table.probe(8)
+        ((0.5, 3, 1), None)
+        """
+        check = fingerprint(key)
+        words = self._words
+        start = self._bucket(check)
+        for i in range(start, start + BUCKET_SIZE * SLOT_WORDS, SLOT_WORDS):
+            value, meta = words[i + 1], words[i + 2]
+            if meta & 1 and words[i] ^ value ^ meta == check:
+                return (_FLOAT.unpack(_WORD.pack(value))[0], meta >> 3,
+                        meta >> 1 & 3)
+        return None
+
+    def store(self, key: int, value: float, depth: int = FULL_DEPTH,
+              flag: int = EXACT) -> None:
+        """
+        Store value, searched depth moves deep, with flag for key.
+        """
+        check = fingerprint(key)
+        words = self._words
+        start = self._bucket(check)
+        target = start
+        shallowest = None
+        for i in range(start, start + BUCKET_SIZE * SLOT_WORDS, SLOT_WORDS):
+            meta = words[i + 2]
+            if not meta & 1 or words[i] ^ words[i + 1] ^ meta == check:
+                target = i
+                break
+            if shallowest is None or meta >> 3 < shallowest:
+                target, shallowest = i, meta >> 3
+        bits = _WORD.unpack(_FLOAT.pack(value))[0]
+        meta = depth << 3 | flag << 1 | 1
+        words[target + 1] = bits
+        words[target + 2] = meta
+        words[target] = check ^ bits ^ meta
+
+    def get(self, key: int, default: Any = None) -> Any:
+        """
+        Return the exact score of a fully searched position with key, or
+        default.
+        """
+        entry = self.probe(key)
+        if entry is None or entry[1] != FULL_DEPTH or entry[2] != EXACT:
+            return default
+        return entry[0]
+
+    def __setitem__(self, key: int, value: float) -> None:
+        """
+        Store value as the exact score of the fully searched position with
+        key.
+        """
+        self.store(key, value)